@@ -0,0 +1,119 @@
+import struct
+
+# Битрейты Layer III, кбит/с: MPEG-1 и MPEG-2/2.5
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+
+# Сведения о MP3-потоке, полученные из заголовков фреймов
+class MP3Info:
+    def __init__(self, duration: float, sample_rate: int, channels: int, frames: int):
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = frames
+
+
+# Длительность сырого PCM по числу сэмплов
+def pcm_duration(num_bytes: int, sample_rate: int, channels: int = 1, sample_width: int = 2) -> float:
+    return num_bytes / (sample_rate * channels * sample_width)
+
+
+# Размер ID3v2-тега в начале файла (0, если тега нет)
+def _id3_size(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+# Разбор 4-байтного заголовка фрейма Layer III: (версия, частота, каналы, сэмплов во фрейме, длина фрейма)
+def _frame_header(data: bytes, pos: int):
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    version = {3: 1, 2: 2, 0: 2.5}.get((data[pos + 1] >> 3) & 0x03)
+    layer = (data[pos + 1] >> 1) & 0x03
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 0x03
+    if version is None or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (data[pos + 2] >> 1) & 0x01
+    channels = 1 if (data[pos + 3] >> 6) == 3 else 2
+    samples = 1152 if version == 1 else 576
+    length = samples // 8 * bitrate // sample_rate + padding
+    return version, sample_rate, channels, samples, length
+
+
+# Число фреймов из заголовка Xing/Info или VBRI первого фрейма, если он описывает весь поток
+def _vbr_frames(data: bytes, pos: int, version, channels: int, stream_bytes: int):
+    side_info = (32 if channels == 2 else 17) if version == 1 else (17 if channels == 2 else 9)
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+        if flags & 0x03 == 0x03:  # есть и число фреймов, и размер потока
+            frames, size = struct.unpack(">II", data[xing + 8:xing + 16])
+            if size == stream_bytes:
+                return frames
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI":
+        size, frames = struct.unpack(">II", data[vbri + 10:vbri + 18])
+        if size == stream_bytes:
+            return frames
+    return None
+
+
+# Точная длительность MP3 за один проход по заголовкам фреймов, без декодирования.
+# Если Xing/VBRI описывает весь поток — берётся из него; иначе (CBR, склеенные
+# ответы gTTS) фреймы пересчитываются по цепочке заголовков.
+def mp3_info(data: bytes) -> MP3Info:
+    pos = _id3_size(data)
+    while pos < len(data) - 4 and _frame_header(data, pos) is None:
+        pos += 1
+    first = _frame_header(data, pos)
+    if first is None:
+        raise ValueError("MP3-фреймы не найдены")
+    version, sample_rate, channels, samples, _ = first
+
+    frames = _vbr_frames(data, pos, version, channels, len(data) - pos)
+    if frames is not None:
+        return MP3Info(frames * samples / sample_rate, sample_rate, channels, frames)
+
+    frames = 0
+    total_samples = 0
+    while pos < len(data):
+        header = _frame_header(data, pos)
+        if header is None:
+            pos = _resync(data, pos)
+            continue
+        frame_version, _, frame_channels, frame_samples, length = header
+        # Служебный фрейм Xing/Info в начале склеенной части декодеры пропускают
+        if _is_info_frame(data, pos, frame_version, frame_channels):
+            pos += length
+            continue
+        frames += 1
+        total_samples += frame_samples
+        pos += length
+    return MP3Info(total_samples / sample_rate, sample_rate, channels, frames)
+
+
+def _is_info_frame(data: bytes, pos: int, version, channels: int) -> bool:
+    side_info = (32 if channels == 2 else 17) if version == 1 else (17 if channels == 2 else 9)
+    return data[pos + 4 + side_info:pos + 8 + side_info] in (b"Xing", b"Info")
+
+
+# Поиск следующего заголовка после мусора или ID3-тега склеенной части
+def _resync(data: bytes, pos: int) -> int:
+    pos += _id3_size(data[pos:pos + 10]) or 1
+    while pos < len(data) - 4 and _frame_header(data, pos) is None:
+        pos += 1
+    return pos if pos < len(data) - 4 else len(data)
@@ -0,0 +1,90 @@
+import os
+import logging
+import numpy as np
+from PIL import Image
+
+from config import AVATAR_PATH, AVATAR_CACHE_DIR
+
+AVATAR_SIZE = (480, 480)
+AVATAR_SLOWDOWN = 2  # каждый кадр GIF показывается дважды (замедление)
+
+# Декодированные аватары: путь -> массив (кадры x 480 x 480 x 3, uint8)
+_avatars = {}
+
+
+# Путь к предрасчитанному .npy для аватара
+def npy_path_for(path: str) -> str:
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(AVATAR_CACHE_DIR, f"{name}_{AVATAR_SIZE[0]}x{AVATAR_SIZE[1]}.npy")
+
+
+# Декодирование GIF в один непрерывный массив кадров
+def decode_avatar(path: str) -> np.ndarray:
+    width, height = AVATAR_SIZE
+    try:
+        with Image.open(path) as gif:
+            frames = np.empty((getattr(gif, "n_frames", 1), height, width, 3), dtype=np.uint8)
+            for i in range(len(frames)):
+                gif.seek(i)
+                frame = gif.convert("RGB")
+                if frame.size != (width, height):
+                    frame = frame.resize((width, height), Image.Resampling.LANCZOS)
+                frames[i] = np.asarray(frame)
+        return frames
+    except FileNotFoundError:
+        logging.error(f"Файл {path} не найден. Использую чёрный фон.")
+    except Exception as e:
+        logging.error(f"Ошибка загрузки GIF: {str(e)}")
+    return np.zeros((15, height, width, 3), dtype=np.uint8)
+
+
+# Сохранение декодированного аватара в .npy (для mmap в воркерах)
+def precompute_avatar(path: str = AVATAR_PATH) -> str:
+    frames = decode_avatar(path)
+    npy_path = npy_path_for(path)
+    os.makedirs(os.path.dirname(npy_path) or ".", exist_ok=True)
+    tmp_path = f"{npy_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, frames)
+    os.replace(tmp_path, npy_path)
+    logging.info(f"Аватар {path} сохранён в {npy_path}: {frames.shape}")
+    return npy_path
+
+
+# Кадры аватара: из памяти, из .npy (mmap, общий page cache для процессов) или декодированием GIF
+def load_avatar(path: str = AVATAR_PATH) -> np.ndarray:
+    frames = _avatars.get(path)
+    if frames is not None:
+        return frames
+    npy_path = npy_path_for(path)
+    try:
+        if not os.path.exists(path) or os.path.getmtime(npy_path) >= os.path.getmtime(path):
+            frames = np.load(npy_path, mmap_mode="r")
+            logging.info(f"Аватар загружен из {npy_path}: {frames.shape}")
+    except (OSError, ValueError):
+        frames = None
+    if frames is None:
+        frames = decode_avatar(path)
+        logging.info(f"Аватар {path} декодирован: {frames.shape}")
+    _avatars[path] = frames
+    return frames
+
+
+# Индексы кадров аватара для ролика из num_frames кадров (замедление + зацикливание)
+def frame_indices(source_frames: int, num_frames: int, slowdown: int = AVATAR_SLOWDOWN) -> np.ndarray:
+    return (np.arange(num_frames) // slowdown) % source_frames
+
+
+# Последовательность кадров нужной длины: ссылки на кадры кэша, без копирования
+def avatar_sequence(num_frames: int, path: str = AVATAR_PATH) -> list:
+    frames = load_avatar(path)
+    return [frames[i] for i in frame_indices(len(frames), num_frames)]
+
+
+# Предзагрузка аватаров при старте процесса-воркера
+def preload_avatars() -> None:
+    load_avatar(AVATAR_PATH)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    precompute_avatar()
@@ -0,0 +1,57 @@
+import os
+import logging
+
+from avatar_cache import AVATAR_SIZE, AVATAR_SLOWDOWN, load_avatar, frame_indices
+from config import AVATAR_PATH, AVATAR_CACHE_DIR, AVATAR_SEGMENT_GOP
+from encoder import EncodeProfile, get_profile, run_ffmpeg, mux_video_note
+
+FPS = 15
+
+
+# Путь к заранее закодированному циклу аватара
+def loop_path_for(path: str, profile: EncodeProfile = None) -> str:
+    name = os.path.splitext(os.path.basename(path))[0]
+    profile = profile or get_profile()
+    return os.path.join(AVATAR_CACHE_DIR, f"{name}_loop_{FPS}fps_g{AVATAR_SEGMENT_GOP}_{profile.name}.mp4")
+
+
+# Однократное кодирование одного цикла аватара в H.264 с фиксированным GOP.
+# B-кадры отключены, поэтому при копировании потока ролик можно обрезать на любом кадре.
+def encode_avatar_loop(path: str = AVATAR_PATH, profile: EncodeProfile = None) -> str:
+    profile = profile or get_profile()
+    frames = load_avatar(path)
+    loop = frames[frame_indices(len(frames), len(frames) * AVATAR_SLOWDOWN)]
+    loop_path = loop_path_for(path, profile)
+    os.makedirs(os.path.dirname(loop_path) or ".", exist_ok=True)
+    tmp_path = f"{loop_path}.{os.getpid()}.tmp.mp4"
+    run_ffmpeg([
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{AVATAR_SIZE[0]}x{AVATAR_SIZE[1]}", "-r", str(FPS),
+        "-i", "pipe:0",
+    ] + profile.video_args(FPS, threads=os.cpu_count() or 1, keyint=AVATAR_SEGMENT_GOP) + [
+        "-bf", "0", "-keyint_min", str(AVATAR_SEGMENT_GOP), "-sc_threshold", "0",
+        "-an", tmp_path,
+    ], input=loop.tobytes())
+    os.replace(tmp_path, loop_path)
+    logging.info(f"Цикл аватара закодирован: {loop_path}, {len(loop)} кадров")
+    return loop_path
+
+
+# Путь к циклу аватара; кодирует его при первом обращении
+def avatar_loop(path: str = AVATAR_PATH, profile: EncodeProfile = None) -> str:
+    loop_path = loop_path_for(path, profile)
+    if os.path.exists(loop_path) and (not os.path.exists(path) or os.path.getmtime(loop_path) >= os.path.getmtime(path)):
+        return loop_path
+    return encode_avatar_loop(path, profile)
+
+
+# Сборка видеокружка: цикл аватара повторяется копированием потока и обрезается
+# по длительности аудио; кодируется только AAC-дорожка
+def assemble_from_segments(speech, profile: EncodeProfile = None) -> bytes:
+    video_data = mux_video_note(avatar_loop(profile=profile), speech, profile=profile)
+    logging.info(f"Видео собрано из цикла аватара: {len(video_data) / (1024 * 1024):.2f} МБ")
+    return video_data
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    encode_avatar_loop()
@@ -0,0 +1,55 @@
+# Микробенчмарк определения длительности аудио: разбор заголовков MP3 (audio_meta)
+# против декодирования через ffmpeg и прежней пробы moviepy AudioFileClip.
+# Запуск из корня репозитория: python benchmarks/bench_audio_meta.py
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_meta import mp3_info
+from encoder import run_ffmpeg, decode_pcm
+
+
+# MP3 в духе gTTS: моно, 24 кГц, 32 кбит/с
+def make_mp3(duration: float, extra: list = ("-b:a", "32k")) -> bytes:
+    return run_ffmpeg(["-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}", "-ac", "1", "-ar", "24000"]
+                      + list(extra) + ["-f", "mp3", "pipe:1"])
+
+
+def best_of(fn, runs: int) -> tuple:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def moviepy_probe(audio: bytes) -> float:
+    from moviepy.editor import AudioFileClip
+    with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_audio:
+        temp_audio.write(audio)
+    try:
+        clip = AudioFileClip(temp_audio.name)
+        duration = clip.duration
+        clip.close()
+        return duration
+    finally:
+        os.remove(temp_audio.name)
+
+
+if __name__ == "__main__":
+    cases = {
+        "cbr 3с": make_mp3(3.0),
+        "vbr 10с": make_mp3(10.0, ("-q:a", "5")),
+        "склейка": make_mp3(4.0) + make_mp3(6.0),
+    }
+    for name, audio in cases.items():
+        info, t_meta = best_of(lambda: mp3_info(audio), 50)
+        pcm, t_decode = best_of(lambda: decode_pcm(audio, info.sample_rate), 5)
+        moviepy_duration, t_moviepy = best_of(lambda: moviepy_probe(audio), 3)
+        print(f"{name:8s} audio_meta {info.duration:6.3f}с за {t_meta * 1000:7.3f} мс | "
+              f"ffmpeg {len(pcm) / 2 / info.sample_rate:6.3f}с за {t_decode * 1000:6.1f} мс | "
+              f"moviepy {moviepy_duration:6.3f}с за {t_moviepy * 1000:6.1f} мс")
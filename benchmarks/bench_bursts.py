@@ -0,0 +1,172 @@
+# Серии сообщений от одного пользователя: сколько работы рендера выполняется без
+# user_flow.UserFlowMiddleware (USER_FLOW=0) и с ним (склейка, отмена устаревших ответов, лимит).
+# Два режима набора: быстрый (паузы короче USER_DEBOUNCE — сообщения склеиваются) и
+# медленный (паузы длиннее — новое сообщение отменяет уже начатый ответ).
+# Считаются вызовы TTS и сборки видео в пуле, отправленные видеокружки и то, дошло ли
+# до LLM последнее сообщение каждой серии. Каждый сценарий — отдельный процесс; Telegram
+# и OpenRouter подменены заглушками из bench_e2e, TTS — fixed, кэш медиа выключен.
+# Запуск из корня репозитория:
+#   python benchmarks/bench_bursts.py [--users 4] [--messages 4] [--out файл.json]
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+import tempfile
+import warnings
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from bench_e2e import Harness, create_telegram_stub, free_port, git_revision, make_reply, start_server
+from mock_openrouter import create_mock_app
+
+SCENARIOS = ("off", "on")
+GAPS = {"fast": 0.2, "slow": 1.2}  # пауза между сообщениями серии, сек
+
+
+# Подсчёт задач пула по функциям: поставлено, выполнено, отменено, суммарное время
+def count_work(executor, work: dict) -> None:
+    original = executor.run
+
+    async def run(fn, *args):
+        name = fn.__name__
+        work[f"{name}_submitted"] += 1
+        started = time.perf_counter()
+        try:
+            result = await original(fn, *args)
+        except asyncio.CancelledError:
+            work[f"{name}_cancelled"] += 1
+            raise
+        work[f"{name}_done"] += 1
+        work[f"{name}_seconds"] += time.perf_counter() - started
+        return result
+
+    executor.run = run
+
+
+async def burst(harness: Harness, user_id: int, messages: int, gap: float) -> None:
+    tasks = []
+    for i in range(messages):
+        tasks.append(asyncio.create_task(harness.send(user_id, f"сообщение {user_id}-{i}")))
+        await asyncio.sleep(gap)
+    await asyncio.gather(*tasks)
+
+
+async def run_scenario(scenario: str, users: int, messages: int, llm_latency: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_bursts_")
+    mock_port, telegram_port = free_port(), free_port()
+    mock_app = create_mock_app(reply=make_reply(20), latency=llm_latency, token_delay=0.01)
+    telegram_app = create_telegram_stub()
+    runners = [await start_server(mock_app, mock_port), await start_server(telegram_app, telegram_port)]
+
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:BENCH",
+        "OPENROUTER_API_KEY": "bench",
+        "WEBHOOK_HOST": "bench.local",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{mock_port}/api/v1",
+        "TTS_ENGINES": "fixed",
+        "RENDER_BACKEND": "pool",
+        "RENDER_QUEUE_SIZE": str(users * messages * 2),
+        "RENDER_WAIT_TIMEOUT": "600",
+        "MEDIA_CACHE_DIR": os.path.join(workdir, "media"),
+        "MEDIA_CACHE_MAX_MB": "0",
+        "STORAGE_PATH": os.path.join(workdir, "bot.sqlite3"),
+        "WARMUP": "0",
+        "USER_FLOW": "1" if scenario == "on" else "0",
+    })
+    os.chdir(ROOT)
+    import bot as bot_module
+    app = bot_module.create_app()
+    services = app[bot_module.SERVICES]
+    from aiogram.client.telegram import TelegramAPIServer
+    from metrics import USER_TURNS
+
+    logging.getLogger().setLevel(logging.WARNING)
+    services.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{telegram_port}")
+    await services.llm_client.start()
+    await services.storage.start()
+    harness = Harness(bot_module, app, telegram_app)
+
+    results = {}
+    try:
+        await harness.send(user_id=1)  # прогрев пула и аватара не входит в замер
+        for index, (pattern, gap) in enumerate(GAPS.items()):
+            work = defaultdict(float)
+            count_work(services.render_executor, work)
+            calls, prompts = len(telegram_app["calls"]), len(mock_app["prompts"])
+            USER_TURNS._values.clear()
+            base = 1000 * (index + 1)
+            started = time.perf_counter()
+            await asyncio.gather(*(burst(harness, base + user, messages, gap) for user in range(users)))
+            wall = time.perf_counter() - started
+            sent = telegram_app["calls"][calls:]
+            seen = mock_app["prompts"][prompts:]
+            latest = [f"сообщение {base + user}-{messages - 1}" for user in range(users)]
+            results[pattern] = {
+                "gap": gap,
+                "messages": users * messages,
+                "wall_seconds": round(wall, 3),
+                "llm_requests": len(seen),
+                "video_notes": sum(1 for c in sent if c["method"] == "sendVideoNote"),
+                "latest_answered": sum(1 for text in latest if any(text in prompt for prompt in seen)),
+                "work": {name: round(value, 3) for name, value in sorted(work.items())},
+                "turns": {key[0]: value for key, value in USER_TURNS._values.items()},
+            }
+            del services.render_executor.run  # снова метод класса, без подсчёта
+    finally:
+        await services.storage.close()
+        await services.llm_client.close()
+        await services.bot.session.close()
+        services.render_executor.shutdown()
+        for runner in runners:
+            await runner.cleanup()
+    return {"scenario": scenario, "patterns": results}
+
+
+def spawn(scenario: str, args) -> dict:
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--scenario", scenario,
+                             "--users", str(args.users), "--messages", str(args.messages),
+                             "--llm-latency", str(args.llm_latency)],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Серии сообщений: работа рендера с UserFlowMiddleware и без")
+    parser.add_argument("--scenario", choices=SCENARIOS, help="выполнить один сценарий в этом процессе")
+    parser.add_argument("--users", type=int, default=4, help="пользователей, пишущих одновременно")
+    parser.add_argument("--messages", type=int, default=4, help="сообщений в серии")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="задержка заглушки OpenRouter, сек")
+    parser.add_argument("--out", help="путь к JSON (по умолчанию benchmarks/results/bursts_<ревизия>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    warnings.filterwarnings("ignore", "Changing state of started", DeprecationWarning)
+    if args.scenario:
+        print(json.dumps(asyncio.run(run_scenario(args.scenario, args.users, args.messages, args.llm_latency)),
+                         ensure_ascii=False))
+        sys.exit(0)
+
+    results = {"revision": git_revision(), "python": platform.python_version(), "cpu_count": os.cpu_count(),
+               "users": args.users, "messages": args.messages,
+               "scenarios": [spawn(scenario, args) for scenario in SCENARIOS]}
+    for result in results["scenarios"]:
+        for pattern, stats in result["patterns"].items():
+            work = stats["work"]
+            print(f"USER_FLOW={result['scenario']:3s} {pattern:5s}: сборок видео {work.get('render_speech_done', 0):.0f} "
+                  f"({work.get('render_speech_seconds', 0):.2f}с), вызовов TTS {work.get('synthesize_batch_done', 0):.0f}, "
+                  f"запросов LLM {stats['llm_requests']}, видео {stats['video_notes']}, последнее сообщение "
+                  f"учтено {stats['latest_answered']}/{args.users}, {stats['wall_seconds']:.1f}с")
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"bursts_{results['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Результаты: {out}")
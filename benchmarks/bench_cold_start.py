@@ -0,0 +1,118 @@
+# Задержка первого ответа после старта процесса бота: без прогрева и с прогревом
+# (warmup.Warmup — воркеры пула, пробное кодирование, готовые видеокружки фраз).
+# Каждый сценарий — отдельный свежий процесс с пустыми кэшами аватара и медиа, как
+# у нового контейнера; Telegram и OpenRouter подменены заглушками из bench_e2e, TTS — fixed.
+# Запуск из корня репозитория: python benchmarks/bench_cold_start.py [--out файл.json]
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+import tempfile
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from bench_e2e import Harness, create_telegram_stub, free_port, git_revision, make_reply, start_server
+from mock_openrouter import create_mock_app
+
+SCENARIOS = ("cold", "warm")
+
+
+# Один сценарий в текущем процессе: импорт бота, прогрев (для warm), /start и два ответа подряд
+async def run_scenario(scenario: str, tokens: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_cold_")
+    mock_port, telegram_port = free_port(), free_port()
+    mock_app = create_mock_app(latency=0.05, token_delay=0.01)
+    telegram_app = create_telegram_stub()
+    runners = [await start_server(mock_app, mock_port), await start_server(telegram_app, telegram_port)]
+
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:BENCH",
+        "OPENROUTER_API_KEY": "bench",
+        "WEBHOOK_HOST": "bench.local",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{mock_port}/api/v1",
+        "TTS_ENGINES": "fixed",
+        "RENDER_BACKEND": "pool",
+        "AVATAR_CACHE_DIR": os.path.join(workdir, "avatar"),
+        "MEDIA_CACHE_DIR": os.path.join(workdir, "media"),
+        "STORAGE_PATH": os.path.join(workdir, "bot.sqlite3"),
+        "WARMUP": "1" if scenario == "warm" else "0",
+        "WARMUP_CHAT_ID": "-1000000000001",
+        "USER_FLOW": "0",  # пауза склейки сообщений добавила бы к каждому ответу USER_DEBOUNCE; см. bench_bursts.py
+    })
+    os.chdir(ROOT)
+    started = time.perf_counter()
+    import bot as bot_module
+    app = bot_module.create_app()
+    services = app[bot_module.SERVICES]
+    import_seconds = time.perf_counter() - started
+    from aiogram.client.telegram import TelegramAPIServer
+
+    logging.getLogger().setLevel(logging.WARNING)
+    services.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{telegram_port}")
+    await services.llm_client.start()
+    await services.storage.start()
+    harness = Harness(bot_module, app, telegram_app)
+
+    result = {"scenario": scenario, "import_seconds": round(import_seconds, 4)}
+    try:
+        if scenario == "warm":
+            timings = await services.warmup.run()
+            result["warmup"] = {stage: round(value, 4) for stage, value in timings.items()}
+        calls = len(telegram_app["calls"])
+        await harness.send(user_id=1, text="/start")
+        result["greeting_video"] = any(c["method"] == "sendVideoNote" for c in telegram_app["calls"][calls:])
+        mock_app["reply"] = make_reply(tokens)
+        result["first_reply_seconds"] = round(await harness.send(user_id=2), 4)
+        mock_app["reply"] = make_reply(tokens + 1)  # другой текст, чтобы не попасть в кэш медиа
+        result["second_reply_seconds"] = round(await harness.send(user_id=3), 4)
+        result["errors"] = len(harness.collect(0, 0)["errors"])
+    finally:
+        await services.storage.close()
+        await services.llm_client.close()
+        await services.bot.session.close()
+        services.render_executor.shutdown()
+        for runner in runners:
+            await runner.cleanup()
+    return result
+
+
+def spawn(scenario: str, tokens: int) -> dict:
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--scenario", scenario, "--tokens", str(tokens)],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка первого ответа с прогревом и без")
+    parser.add_argument("--scenario", choices=SCENARIOS, help="выполнить один сценарий в этом процессе")
+    parser.add_argument("--tokens", type=int, default=20, help="длина ответа в токенах")
+    parser.add_argument("--out", help="путь к JSON (по умолчанию benchmarks/results/cold_start_<ревизия>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    warnings.filterwarnings("ignore", "Changing state of started", DeprecationWarning)
+    if args.scenario:
+        print(json.dumps(asyncio.run(run_scenario(args.scenario, args.tokens)), ensure_ascii=False))
+        sys.exit(0)
+
+    results = {"revision": git_revision(), "python": platform.python_version(), "cpu_count": os.cpu_count(),
+               "tokens": args.tokens, "scenarios": [spawn(scenario, args.tokens) for scenario in SCENARIOS]}
+    for result in results["scenarios"]:
+        warm = f", прогрев {result['warmup']['total']:.2f}с" if "warmup" in result else ""
+        print(f"{result['scenario']:5s}: первый ответ {result['first_reply_seconds']:.2f}с, "
+              f"второй {result['second_reply_seconds']:.2f}с, видео на /start: "
+              f"{'да' if result['greeting_video'] else 'нет'}{warm}")
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"cold_start_{results['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Результаты: {out}")
@@ -0,0 +1,79 @@
+# Стоимость композитора (субтитры + анимация рта) относительно нетронутых кадров аватара:
+# отдельно сборка кадров и полный рендер с кодированием. Цель — не дороже x2.
+# Запуск из корня репозитория: python benchmarks/bench_compositor.py [секунды ...]
+import os
+import sys
+import time
+import logging
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render
+from avatar_cache import avatar_sequence, load_avatar
+from compositor import Compositor, MouthSprites, caption_schedule, rms_envelope
+from encoder import encode_video_note
+from tts import FixedAudioEngine
+
+TEXT = ("Привет! Рада тебя слышать. Как прошёл твой день? Расскажи, что нового случилось "
+        "за эту неделю, а я поделюсь своими новостями и парой советов на выходные.")
+
+
+# Синтетическая полоса спрайтов рта: 4 эллипса от закрытого к открытому
+def make_sprites(path: str) -> None:
+    levels, size = 4, 64
+    strip = np.zeros((size, size * levels, 4), dtype=np.uint8)
+    yy, xx = np.mgrid[:size, :size]
+    for level in range(levels):
+        inside = ((xx - size / 2) / (size * 0.4)) ** 2 + ((yy - size / 2) / (size * (0.05 + 0.1 * level))) ** 2 <= 1
+        strip[:, level * size:(level + 1) * size][inside] = (120, 30, 40, 255)
+    Image.fromarray(strip).save(path)
+
+
+def best_of(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def consume(chunks) -> None:
+    for chunk in chunks:
+        memoryview(chunk)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    durations = [float(x) for x in sys.argv[1:]] or [5.0, 20.0]
+    sprite_path = os.path.join(tempfile.mkdtemp(), "mouth.png")
+    make_sprites(sprite_path)
+    sprites = MouthSprites(sprite_path, (208, 300))
+    font = render.load_font(26)
+    load_avatar()
+
+    for duration in durations:
+        speech = FixedAudioEngine().synthesize("а" * int(duration * 14))
+        num_frames = int(speech.duration * render.VIDEO_FPS)
+
+        def plain_frames():
+            return avatar_sequence(num_frames)
+
+        def composed_frames():
+            lines = render.split_text_for_display(TEXT, int(render.VIDEO_SIZE * 0.75), font)
+            captions = caption_schedule(lines, font, num_frames)
+            envelope = rms_envelope(speech.data, speech.sample_rate, num_frames, render.VIDEO_FPS)
+            return Compositor(num_frames, captions, envelope, sprites).chunks()
+
+        build_plain = best_of(lambda: consume(plain_frames()), runs=5)
+        build_composed = best_of(lambda: consume(composed_frames()), runs=5)
+        encode_plain = best_of(lambda: encode_video_note(plain_frames(), speech, fps=render.VIDEO_FPS), runs=2)
+        encode_composed = best_of(lambda: encode_video_note(composed_frames(), speech, fps=render.VIDEO_FPS), runs=2)
+        print(f"{duration:5.1f} с, {num_frames} кадров:")
+        print(f"  сборка кадров:   без наложений {build_plain * 1000:7.1f} мс, композитор {build_composed * 1000:7.1f} мс")
+        print(f"  рендер целиком:  без наложений {encode_plain * 1000:7.1f} мс, композитор {encode_composed * 1000:7.1f} мс, "
+              f"x{encode_composed / encode_plain:.2f}")
@@ -0,0 +1,365 @@
+# Сквозной бенчмарк ответа: синтетические апдейты идут в handle_message,
+# Telegram API и OpenRouter подменены локальными серверами, TTS — заглушкой
+# с фиксированным тоном (TTS_ENGINES=fixed), кэш медиа выключен.
+# Замеряет задержки этапов, пропускную способность при N одновременных
+# пользователях, пиковый RSS и размер видео для ответов от 1 до 150 токенов.
+# Запуск из корня репозитория:
+#   python benchmarks/bench_e2e.py [--lengths 1 10 50 150] [--users 1 4 8] [--runs 3] [--out файл.json]
+# Результат — JSON с отсортированными ключами, удобный для diff между коммитами.
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import warnings
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web
+
+from mock_openrouter import create_mock_app
+
+# Слова для ответа нужной длины; точка каждые 10 слов, чтобы работала нарезка на предложения
+WORDS = ("сегодня отличный день чтобы поговорить о чём нибудь приятном и рассказать "
+         "что нового случилось у тебя за эту неделю").split()
+
+
+def make_reply(tokens: int) -> str:
+    words = []
+    for i in range(tokens):
+        word = WORDS[i % len(WORDS)]
+        words.append(word + "." if (i + 1) % 10 == 0 or i == tokens - 1 else word)
+    words[0] = words[0].capitalize()
+    return " ".join(words)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+# --- Заглушка Telegram Bot API ---
+
+def create_telegram_stub() -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["calls"] = []
+    counter = iter(range(1, 1 << 62))
+
+    async def method(request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        fields = await request.post()
+        if name == "deleteMessage":
+            return web.json_response({"ok": True, "result": True})
+        message_id = next(counter)
+        result = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(fields.get("chat_id", 0)), "type": "private"},
+        }
+        call = {"method": name}
+        if name == "sendVideoNote":
+            # aiogram передаёт файл отдельной частью (video_note=attach://<имя>)
+            call["bytes"] = sum(len(value.file.read()) for value in fields.values() if isinstance(value, web.FileField))
+            result["video_note"] = {"file_id": f"bench-{message_id}", "file_unique_id": f"u{message_id}",
+                                    "length": 480, "duration": int(fields.get("duration", 0))}
+        elif name == "sendMessage":
+            call["text"] = fields.get("text", "")
+            result["text"] = call["text"]
+        app["calls"].append(call)
+        return web.json_response({"ok": True, "result": result})
+
+    app.router.add_post("/bot{token}/{method}", method)
+    return app
+
+
+async def start_server(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+# --- Память: пиковый RSS процесса бота и воркеров пула рендера ---
+
+def worker_pids(services) -> list:
+    executor = services.render_executor._executor
+    return list(executor._processes) if executor is not None else []
+
+
+def reset_peak_rss(pids: list) -> None:
+    for pid in ["self"] + pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", "w") as f:
+                f.write("5")  # сброс VmHWM (Linux)
+        except OSError:
+            pass
+
+
+def peak_rss_mb(pid) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def memory_snapshot(services) -> dict:
+    workers = [peak_rss_mb(pid) for pid in worker_pids(services)]
+    return {"bot_peak_rss_mb": round(peak_rss_mb("self"), 1),
+            "worker_peak_rss_mb": round(max(workers, default=0.0), 1),
+            "workers": len(workers)}
+
+
+# --- Прогон сообщений через диспетчер ---
+
+class Harness:
+    def __init__(self, bot_module, app: web.Application, telegram_app: web.Application):
+        self.dp = app[bot_module.DISPATCHER]
+        self.services = app[bot_module.SERVICES]
+        self.telegram = telegram_app
+        self.timings = []
+        self.next_id = 0
+        original = bot_module.log_timings
+
+        def capture(timings: dict) -> None:
+            self.timings.append(dict(timings))
+            original(timings)
+
+        bot_module.log_timings = capture
+
+    def make_update(self, user_id: int, text: str):
+        from aiogram.types import Update
+        self.next_id += 1
+        return Update.model_validate({
+            "update_id": self.next_id,
+            "message": {
+                "message_id": self.next_id,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+                "text": text,
+            },
+        }, context={"bot": self.services.bot})
+
+    # Одно сообщение: время от апдейта до отправки текстового ответа
+    async def send(self, user_id: int, text: str = "Привет, как дела?") -> float:
+        started = time.perf_counter()
+        await self.dp.feed_update(self.services.bot, self.make_update(user_id, text))
+        return time.perf_counter() - started
+
+    def collect(self, since_calls: int, since_timings: int) -> dict:
+        calls = self.telegram["calls"][since_calls:]
+        errors = [c["text"] for c in calls if c["method"] == "sendMessage"
+                  and c["text"].startswith(("Ой, что-то пошло не так", "Подожди немного"))]
+        return {
+            "timings": self.timings[since_timings:],
+            "video_bytes": [c["bytes"] for c in calls if c["method"] == "sendVideoNote"],
+            "errors": errors,
+        }
+
+
+def median_timings(timings: list) -> dict:
+    stages = sorted({stage for t in timings for stage in t})
+    return {stage: round(statistics.median(t[stage] for t in timings if stage in t), 4) for stage in stages}
+
+
+# Этапы внутри воркера, которые не видны из handle_message: определение длительности
+# аудио, сборка кадров и кодирование (оба режима рендера), в текущем процессе
+def worker_stages(text: str) -> dict:
+    import render
+    from audio_meta import mp3_info
+    from avatar_cache import avatar_sequence
+    from avatar_segments import assemble_from_segments, avatar_loop
+    from encoder import encode_video_note, run_ffmpeg
+    from tts import get_engine
+
+    stages = {}
+    speech = get_engine().synthesize(render.remove_emojis(text))
+    mp3 = run_ffmpeg(["-f", "s16le", "-ar", str(speech.sample_rate), "-ac", "1", "-i", "pipe:0",
+                      "-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3", "pipe:1"], input=speech.data)
+
+    started = time.perf_counter()
+    mp3_info(mp3)
+    stages["duration_probe"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    frames = avatar_sequence(int(speech.duration * render.VIDEO_FPS))
+    stages["frame_assembly"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    encode_video_note(frames, speech, fps=render.VIDEO_FPS)
+    stages["encode_frames"] = time.perf_counter() - started
+
+    profile = render.get_profile(render.ENCODE_PROFILE or "small")
+    avatar_loop(profile=profile)  # однократная подготовка цикла не входит в замер
+    started = time.perf_counter()
+    assemble_from_segments(speech, profile=profile)
+    stages["encode_segments"] = time.perf_counter() - started
+
+    stages["audio_seconds"] = speech.duration
+    return {name: round(value, 4) for name, value in stages.items()}
+
+
+async def bench_lengths(harness: Harness, mock_app: web.Application, lengths: list, runs: int) -> list:
+    results = []
+    for tokens in lengths:
+        mock_app["reply"] = make_reply(tokens)
+        reset_peak_rss(worker_pids(harness.services))
+        calls, timings = len(harness.telegram["calls"]), len(harness.timings)
+        latencies = [await harness.send(user_id=100000 + tokens * 100 + run) for run in range(runs)]
+        collected = harness.collect(calls, timings)
+        stages = median_timings(collected["timings"])
+        stages.update(await asyncio.to_thread(worker_stages, mock_app["reply"]))
+        result = {
+            "tokens": tokens,
+            "runs": runs,
+            "latency_median": round(statistics.median(latencies), 4),
+            "stages": stages,
+            "video_bytes": max(collected["video_bytes"], default=0),
+            "errors": len(collected["errors"]),
+        }
+        result.update(memory_snapshot(harness.services))
+        print(f"{tokens:4d} токенов: {result['latency_median']:.2f}с, видео {result['video_bytes'] / 1024:.0f} КБ, "
+              f"этапы {stages}")
+        results.append(result)
+    return results
+
+
+async def bench_throughput(harness: Harness, mock_app: web.Application, users: list, tokens: int) -> list:
+    mock_app["reply"] = make_reply(tokens)
+    results = []
+    for count in users:
+        reset_peak_rss(worker_pids(harness.services))
+        calls, timings = len(harness.telegram["calls"]), len(harness.timings)
+        base = 200000 + count * 1000
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(harness.send(user_id=base + i) for i in range(count)))
+        wall = time.perf_counter() - started
+        collected = harness.collect(calls, timings)
+        replies = len(collected["video_bytes"])
+        result = {
+            "users": count,
+            "tokens": tokens,
+            "wall_seconds": round(wall, 4),
+            "replies_per_second": round(replies / wall, 3),
+            "latency_p50": round(percentile(latencies, 0.5), 4),
+            "latency_p95": round(percentile(latencies, 0.95), 4),
+            "videos": replies,
+            "errors": len(collected["errors"]),
+        }
+        result.update(memory_snapshot(harness.services))
+        print(f"{count:3d} пользователей: {result['replies_per_second']:.2f} отв/с, "
+              f"p50 {result['latency_p50']:.2f}с, p95 {result['latency_p95']:.2f}с, ошибок {result['errors']}")
+        results.append(result)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    mock_port, telegram_port = free_port(), free_port()
+    mock_app = create_mock_app(latency=args.llm_latency, token_delay=args.token_delay)
+    telegram_app = create_telegram_stub()
+    runners = [await start_server(mock_app, mock_port), await start_server(telegram_app, telegram_port)]
+
+    # Окружение бота задаётся до импорта config
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:BENCH",
+        "OPENROUTER_API_KEY": "bench",
+        "WEBHOOK_HOST": "bench.local",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{mock_port}/api/v1",
+        "TTS_ENGINES": "fixed",
+        "RENDER_BACKEND": "pool",
+        "RENDER_QUEUE_SIZE": str(max(args.users) * 2),
+        "RENDER_WAIT_TIMEOUT": "600",
+        "MEDIA_CACHE_DIR": os.path.join(workdir, "media"),
+        "MEDIA_CACHE_MAX_MB": "0",  # каждый ответ рендерится заново
+        "STORAGE_PATH": os.path.join(workdir, "bot.sqlite3"),
+        "USER_FLOW": "0",  # пауза склейки сообщений добавила бы к каждому ответу USER_DEBOUNCE; см. bench_bursts.py
+    })
+    os.chdir(ROOT)
+    import bot as bot_module
+    app = bot_module.create_app()
+    services = app[bot_module.SERVICES]
+    from aiogram.client.telegram import TelegramAPIServer
+
+    logging.getLogger().setLevel(logging.WARNING)
+    services.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{telegram_port}")
+    await services.llm_client.start()
+    await services.storage.start()
+    harness = Harness(bot_module, app, telegram_app)
+
+    try:
+        await harness.send(user_id=1)  # прогрев: пул процессов, кадры аватара, соединения
+        lengths = await bench_lengths(harness, mock_app, args.lengths, args.runs)
+        throughput = await bench_throughput(harness, mock_app, args.users, args.throughput_tokens)
+    finally:
+        await services.storage.close()
+        await services.llm_client.close()
+        await services.bot.session.close()
+        services.render_executor.shutdown()
+        for runner in runners:
+            await runner.cleanup()
+
+    import render
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "render_mode": render.RENDER_MODE,
+            "render_workers": services.render_executor.workers,
+            "llm_latency": args.llm_latency,
+            "token_delay": args.token_delay,
+        },
+        "lengths": lengths,
+        "throughput": throughput,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк handle_message")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 10, 50, 150], help="длины ответов в токенах")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 8], help="число одновременных пользователей")
+    parser.add_argument("--runs", type=int, default=3, help="повторов на каждую длину ответа")
+    parser.add_argument("--throughput-tokens", type=int, default=50, help="длина ответа в замере пропускной способности")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="задержка заглушки OpenRouter, сек")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="пауза между токенами SSE, сек")
+    parser.add_argument("--out", help="путь к JSON (по умолчанию benchmarks/results/e2e_<ревизия>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    # Заглушка OpenRouter меняет состояние запущенного приложения (счётчики, текст ответа)
+    warnings.filterwarnings("ignore", "Changing state of started", DeprecationWarning)
+    results = asyncio.run(main(args))
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"e2e_{results['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Результаты: {out}")
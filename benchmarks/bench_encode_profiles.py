@@ -0,0 +1,57 @@
+# Сравнение профилей кодирования видеокружка (encoder.PROFILES): время кодирования
+# и МБ на секунду ответа в обоих режимах рендера, плюс прежние настройки x264/AAC по умолчанию.
+# Запуск из корня репозитория: python benchmarks/bench_encode_profiles.py [секунды ...]
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render
+from avatar_cache import avatar_sequence, load_avatar
+from avatar_segments import assemble_from_segments, avatar_loop
+from encoder import PROFILES, EncodeProfile, encode_video_note
+from tts import FixedAudioEngine
+
+
+# Прежние настройки: пресет medium без tune, CRF 23, GOP 250, AAC стерео 128k
+class DefaultProfile(EncodeProfile):
+    def __init__(self):
+        super().__init__("x264-default", "medium", "", 23, 250 / render.VIDEO_FPS)
+
+    def video_args(self, fps: int, threads: int = 0, keyint: int = None) -> list:
+        return ["-c:v", "libx264", "-pix_fmt", "yuv420p"] + (["-g", str(keyint)] if keyint else [])
+
+    def audio_args(self) -> list:
+        return ["-c:a", "aac"]
+
+
+def best_of(fn, runs: int):
+    best, result = None, None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    durations = [float(x) for x in sys.argv[1:]] or [5.0, 20.0]
+    profiles = [DefaultProfile()] + list(PROFILES.values())
+    load_avatar()
+    print(f"{'профиль':14s} {'сек':>5s} {'кадры, с':>9s} {'МБ/с ответа':>12s} {'сегменты, с':>12s} {'МБ/с ответа':>12s}")
+    for profile in profiles:
+        avatar_loop(profile=profile)  # однократная подготовка цикла не входит в замер
+        for duration in durations:
+            speech = FixedAudioEngine().synthesize("а" * int(duration * 14))
+            num_frames = int(speech.duration * render.VIDEO_FPS)
+            frames_time, frames_video = best_of(lambda: encode_video_note(
+                avatar_sequence(num_frames), speech, fps=render.VIDEO_FPS, profile=profile), runs=2)
+            segments_time, segments_video = best_of(lambda: assemble_from_segments(speech, profile=profile), runs=3)
+            mb = 1024 * 1024
+            print(f"{profile.name:14s} {speech.duration:5.1f} {frames_time:9.2f} "
+                  f"{len(frames_video) / mb / speech.duration:12.3f} {segments_time:12.2f} "
+                  f"{len(segments_video) / mb / speech.duration:12.3f}")
@@ -0,0 +1,49 @@
+# Сравнение двух путей сборки видеокружка: покадровое кодирование
+# и готовый цикл аватара с копированием потока.
+# Запуск из корня репозитория: python benchmarks/bench_segments.py [секунды ...]
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render
+from avatar_segments import assemble_from_segments, avatar_loop
+from encoder import run_ffmpeg
+from tts import Speech
+
+
+# Синтетическое аудио нужной длительности (синус в mp3)
+def make_audio(duration: float) -> Speech:
+    sample_rate = 24000
+    pcm = run_ffmpeg(["-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}",
+                      "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"])
+    return Speech(pcm, sample_rate)
+
+
+def bench(name: str, fn, duration: float, runs: int) -> float:
+    audio = make_audio(duration)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        video_data = fn(audio)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"{name:10s} {duration:5.1f} с аудио: {best * 1000:8.1f} мс (лучший из {runs}), {len(video_data) / 1024:.0f} КБ")
+    return best
+
+
+def frames_path(speech: Speech) -> bytes:
+    render.RENDER_MODE = "frames"
+    return render.create_animation("", speech)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    durations = [float(x) for x in sys.argv[1:]] or [3.0, 10.0]
+    avatar_loop()  # однократная подготовка цикла не входит в замер
+    for duration in durations:
+        slow = bench("frames", frames_path, duration, runs=2)
+        fast = bench("segments", assemble_from_segments, duration, runs=5)
+        print(f"ускорение: x{slow / fast:.1f}")
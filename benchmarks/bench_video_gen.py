@@ -0,0 +1,47 @@
+# Пропускная способность рендеров видеокружка: create_animation (цикл аватара и покадровый
+# режим) против ImprovedVideoGenerator (покадрово с субтитрами, общий буфер кадров).
+# Запуск из корня репозитория: python benchmarks/bench_video_gen.py [секунды ответа] [число рендеров]
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render
+from avatar_cache import load_avatar
+from avatar_segments import avatar_loop
+from improved_video_gen import ImprovedVideoGenerator
+from tts import FixedAudioEngine
+
+TEXT = ("Привет! Рада тебя слышать. Как прошёл твой день? Расскажи, что нового случилось "
+        "за эту неделю, а я поделюсь своими новостями и парой советов на выходные.")
+
+
+def animation(mode: str):
+    def run(text, speech):
+        render.RENDER_MODE = mode
+        return render.create_animation(text, speech)
+    return run
+
+
+def throughput(name: str, fn, speech, renders: int) -> None:
+    fn(TEXT, speech)  # прогрев: кадры аватара, шрифт, цикл
+    started = time.perf_counter()
+    sizes = [len(fn(TEXT, speech)) for _ in range(renders)]
+    elapsed = time.perf_counter() - started
+    print(f"{name:24s} {renders / elapsed:6.2f} рендеров/с, {renders * speech.duration / elapsed:7.1f} с видео/с, "
+          f"{sum(sizes) / len(sizes) / 1024:6.0f} КБ")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    renders = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    speech = FixedAudioEngine().synthesize("а" * int(duration * 14))
+    load_avatar()
+    avatar_loop(profile=render.encode_profile())
+    print(f"Ответ {speech.duration:.1f} с, {renders} рендеров подряд в одном процессе")
+    throughput("create_animation/seg", animation("segments"), speech, renders)
+    throughput("create_animation/frames", animation("frames"), speech, renders)
+    throughput("ImprovedVideoGenerator", ImprovedVideoGenerator().render, speech, renders)
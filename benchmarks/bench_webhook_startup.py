@@ -0,0 +1,113 @@
+# Старт webhook-процесса без рендера (RENDER_BACKEND=queue, рендер в render_worker.py):
+# время импорта bot.py и create_app(), RSS после старта и какие тяжёлые модули рендера
+# оказались загружены. Каждый замер — свежий интерпретатор; --compare REV дополнительно
+# меряет то же на дереве другой ревизии (git archive во временный каталог).
+# Запуск из корня репозитория:
+#   python benchmarks/bench_webhook_startup.py [--runs 5] [--compare 1abe23e] [--out файл.json]
+import os
+import sys
+import json
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from bench_e2e import git_revision
+
+HEAVY_MODULES = ("numpy", "PIL", "moviepy", "imageio", "imageio_ffmpeg", "gtts", "avatar_cache", "compositor")
+
+# Выполняется в отдельном процессе в корне проверяемого дерева
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import bot
+imported = time.perf_counter() - started
+if hasattr(bot, "create_app"):
+    bot.create_app()
+total = time.perf_counter() - started
+status = dict(line.split(":", 1) for line in open("/proc/self/status") if ":" in line)
+print(json.dumps({
+    "import_seconds": imported,
+    "startup_seconds": total,
+    "rss_mb": int(status["VmRSS"].split()[0]) / 1024,
+    "peak_rss_mb": int(status["VmHWM"].split()[0]) / 1024,
+    "modules": len(sys.modules),
+    "heavy": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def probe(tree: str, workdir: str, importtime: bool = False) -> tuple:
+    env = dict(os.environ, TELEGRAM_TOKEN="123456:BENCH", OPENROUTER_API_KEY="bench", WEBHOOK_HOST="bench.local",
+               RENDER_BACKEND="queue", WARMUP="0", SET_WEBHOOK="0",
+               STORAGE_PATH=os.path.join(workdir, "bot.sqlite3"), JOB_QUEUE_PATH=os.path.join(workdir, "jobs.sqlite3"),
+               MEDIA_CACHE_DIR=os.path.join(workdir, "media"))
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE]
+    completed = subprocess.run(command, cwd=tree, env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+# Самые дорогие прямые импорты bot.py по накопленному времени (-X importtime, отступ — уровень вложенности)
+def top_imports(stderr: str, count: int = 8) -> list:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth == 1:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return [{"module": name, "seconds": round(seconds, 4)} for seconds, name in sorted(rows, reverse=True)[:count]]
+
+
+def measure(tree: str, runs: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_webhook_")
+    samples = [probe(tree, workdir)[0] for _ in range(runs)]
+    last, stderr = probe(tree, workdir, importtime=True)
+    return {
+        "import_seconds": round(statistics.median(s["import_seconds"] for s in samples), 4),
+        "startup_seconds": round(statistics.median(s["startup_seconds"] for s in samples), 4),
+        "rss_mb": round(statistics.median(s["rss_mb"] for s in samples), 1),
+        "peak_rss_mb": round(statistics.median(s["peak_rss_mb"] for s in samples), 1),
+        "modules": last["modules"],
+        "heavy_modules": last["heavy"],
+        "top_imports": top_imports(stderr),
+    }
+
+
+def export_revision(revision: str) -> str:
+    tree = tempfile.mkdtemp(prefix=f"bench_webhook_{revision}_")
+    archive = subprocess.run(["git", "archive", revision], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", tree], input=archive, check=True)
+    return tree
+
+
+def report(label: str, result: dict) -> None:
+    print(f"{label:10s}: импорт {result['import_seconds']:.2f}с, старт {result['startup_seconds']:.2f}с, "
+          f"RSS {result['rss_mb']:.0f} МБ (пик {result['peak_rss_mb']:.0f}), модулей {result['modules']}, "
+          f"тяжёлые: {', '.join(result['heavy_modules']) or 'нет'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт и память webhook-процесса без рендера")
+    parser.add_argument("--runs", type=int, default=5, help="замеров на каждое дерево (медиана)")
+    parser.add_argument("--compare", help="ревизия для сравнения, например предыдущий коммит")
+    parser.add_argument("--out", help="путь к JSON (по умолчанию benchmarks/results/webhook_startup_<ревизия>.json)")
+    args = parser.parse_args()
+
+    results = {"revision": git_revision(), "python": platform.python_version(), "cpu_count": os.cpu_count(),
+               "runs": args.runs, "current": measure(ROOT, args.runs)}
+    if args.compare:
+        results["compare"] = {"revision": args.compare, **measure(export_revision(args.compare), args.runs)}
+        report(args.compare, results["compare"])
+    report("текущее", results["current"])
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"webhook_startup_{results['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Результаты: {out}")
@@ -1,97 +1,154 @@
 import os
+import time
+import asyncio
 import logging
-import aiohttp
-import io
-import numpy as np
-import tempfile
-import warnings
-import re
-from aiogram import Bot, Dispatcher
-from aiogram.types import Message, BufferedInputFile
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
 from aiogram.filters import Command
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
-from dotenv import load_dotenv
-from PIL import Image, ImageDraw, ImageFont
-from gtts import gTTS
-from moviepy.editor import ImageSequenceClip, AudioFileClip
-from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.filters import CommandStart
 from aiogram import F
-
-class Conversation(StatesGroup):
-    chatting = State()
-
-# Подавление предупреждений о синтаксисе в moviepy
-warnings.filterwarnings("ignore", category=SyntaxWarning)
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-
-# Загрузка переменных окружения
-load_dotenv()
-TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
-OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
-WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', 'https://talkbubblesbot-production.up.railway.app')
-
-if not TELEGRAM_TOKEN:
-    raise ValueError("TELEGRAM_TOKEN not set")
-if not OPENROUTER_API_KEY:
-    raise ValueError("OPENROUTER_API_KEY not set")
-if not WEBHOOK_HOST:
-    raise ValueError("WEBHOOK_HOST not set")
-
-bot = Bot(token=TELEGRAM_TOKEN)
-dp = Dispatcher()
-
-# Глобальный объект app для aiohttp
-app = web.Application()
-
-# Кэширование шрифта
-FONT = None
-def load_font(size=16):
-    global FONT
-    if FONT is None or FONT.size != size:
-        try:
-            FONT = ImageFont.truetype("fonts/arial.ttf", size)
-            logging.info(f"Шрифт arial.ttf успешно загружен, размер {size}")
-        except:
-            FONT = ImageFont.load_default()
-            logging.warning("Шрифт arial.ttf не найден, используется дефолтный")
-    return FONT
-
-# Удаление смайликов из текста
-def remove_emojis(text: str) -> str:
-    emoji_pattern = re.compile(
-        "["
-        u"\U0001F600-\U0001F64F"  # Эмодзи (улыбки, лица)
-        u"\U0001F300-\U0001F5FF"  # Символы и пиктограммы
-        u"\U0001F680-\U0001F6FF"  # Транспорт и карты
-        u"\U0001F700-\U0001F77F"  # Алхимические символы
-        u"\U0001F780-\U0001F7FF"  # Геометрические фигуры
-        u"\U0001F800-\U0001F8FF"  # Стрелки
-        u"\U0001F900-\U0001F9FF"  # Дополнительные эмодзи
-        u"\U0001FA00-\U0001FA6F"  # Шахматы и др.
-        u"\U0001FA70-\U0001FAFF"  # Новые эмодзи
-        u"\U00002700-\U000027BF"  # Декоративные символы
-        u"\U00002600-\U000026FF"  # Разные символы
-        "]+", flags=re.UNICODE)
-    return emoji_pattern.sub(r'', text)
+from config import RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_PER_USER, RENDER_WAIT_TIMEOUT
+from config import MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB
+from config import OPENROUTER_BASE_URL, LLM_MODEL, LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_RETRIES, LLM_POOL_SIZE
+from config import PIPELINE_TTS_CONCURRENCY
+from config import STORAGE_PATH, HISTORY_MAX_TOKENS, HISTORY_SUMMARY_TOKENS, STORAGE_FLUSH_INTERVAL
+from config import RENDER_BACKEND, JOB_QUEUE_PATH, JOB_LEASE, JOB_MAX_ATTEMPTS, SET_WEBHOOK
+from config import USER_FLOW, USER_DEBOUNCE, USER_TURNS_PER_MINUTE, USER_TURNS_BURST, CREDITS_REQUIRED
+from config import WARMUP, WARMUP_PHRASES, WARMUP_CHAT_ID, GREETING_PHRASE, FALLBACK_PHRASE
+from job_queue import JobQueue
+from metrics import RENDERS_IN_FLIGHT, RENDER_QUEUE_DEPTH, metrics_handler, new_trace
+from delivery import send_video_note
+from llm_client import LLMClient
+from pipeline import ReplyPipeline, log_timings, speakable
+from render import preload_render, remove_emojis
+from media_cache import MediaCache
+from render_pool import RenderExecutor, RenderRejected
+from storage import Storage
+from user_flow import Turn, UserFlowMiddleware
+from warmup import Warmup
+
+# Объекты работающего бота. Их создаёт create_app() и кладёт в workflow data диспетчера,
+# откуда aiogram передаёт их обработчикам параметром services; импорт модуля не имеет
+# побочных эффектов и не загружает зависимости рендера (они импортируются в процессах-воркерах).
+# В режиме очереди (RENDER_BACKEND=queue) пула рендера, кэша медиа, конвейера и прогрева нет — None
+class BotServices:
+    def __init__(self, bot: Bot, llm_client: LLMClient, storage: Storage, webhook_host: str,
+                 job_queue: JobQueue = None, render_executor: RenderExecutor = None, media_cache: MediaCache = None,
+                 reply_pipeline: ReplyPipeline = None, warmup: Warmup = None):
+        self.bot = bot
+        self.llm_client = llm_client
+        self.storage = storage
+        self.webhook_host = webhook_host
+        self.job_queue = job_queue
+        self.render_executor = render_executor
+        self.media_cache = media_cache
+        self.reply_pipeline = reply_pipeline
+        self.warmup = warmup
+
+
+# Ключи aiohttp-приложения, по которым create_app() оставляет диспетчер и объекты бота (для бенчмарков)
+DISPATCHER = web.AppKey("dispatcher", Dispatcher)
+SERVICES = web.AppKey("services", BotServices)
+
+
+# Фабрика приложения: окружение, логирование и все объекты бота. Каждый вызов создаёт
+# независимый набор объектов со своим роутером (роутер подключается только к одному диспетчеру)
+def create_app() -> web.Application:
+    # Настройка логирования
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    # Переменные окружения (.env загружен при импорте config)
+    telegram_token = os.getenv('TELEGRAM_TOKEN')
+    openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
+    webhook_host = os.getenv('WEBHOOK_HOST', 'https://talkbubblesbot-production.up.railway.app')
+
+    if not telegram_token:
+        raise ValueError("TELEGRAM_TOKEN not set")
+    if not openrouter_api_key:
+        raise ValueError("OPENROUTER_API_KEY not set")
+    if not webhook_host:
+        raise ValueError("WEBHOOK_HOST not set")
+
+    bot = Bot(token=telegram_token)
+    dp = Dispatcher()
+    dp.include_router(create_router())
+
+    app = web.Application()
+
+    # Клиент OpenRouter с общей сессией (открывается при старте aiohttp-приложения)
+    llm_client = LLMClient(openrouter_api_key, OPENROUTER_BASE_URL, LLM_MODEL, timeout=LLM_TIMEOUT,
+                           connect_timeout=LLM_CONNECT_TIMEOUT, retries=LLM_RETRIES, pool_size=LLM_POOL_SIZE)
+    app.on_startup.append(llm_client.start)
+    app.on_cleanup.append(llm_client.close)
+
+    # Балансы и история диалогов в SQLite (открывается при старте aiohttp-приложения)
+    storage = Storage(STORAGE_PATH, history_tokens=HISTORY_MAX_TOKENS, summary_tokens=HISTORY_SUMMARY_TOKENS,
+                      flush_interval=STORAGE_FLUSH_INTERVAL)
+    app.on_startup.append(storage.start)
+    app.on_cleanup.append(storage.close)
+
+    # Серии сообщений склеиваются в один ход, устаревшие ответы отменяются до кодирования,
+    # частота ходов ограничена ведром токенов (с учётом баланса кредитов, если они обязательны)
+    if USER_FLOW:
+        dp.message.middleware(UserFlowMiddleware(USER_DEBOUNCE, USER_TURNS_PER_MINUTE / 60, USER_TURNS_BURST,
+                                                 balance=storage.get_balance if CREDITS_REQUIRED else None))
+
+    if RENDER_BACKEND == "queue":
+        # Очередь задач для отдельных процессов render_worker.py: пул рендера, кэш медиа и прогрев
+        # живут там, webhook-процесс не запускает процессов рендера
+        job_queue = JobQueue(JOB_QUEUE_PATH, lease=JOB_LEASE, max_attempts=JOB_MAX_ATTEMPTS)
+        render_executor = media_cache = reply_pipeline = warmup = None
+        # Метрики Prometheus (GET /metrics): загрузка рендера считывается при каждом опросе
+        RENDERS_IN_FLIGHT.set_function(job_queue.running)
+        RENDER_QUEUE_DEPTH.set_function(job_queue.depth)
+    else:
+        job_queue = None
+        # Пул процессов для TTS и кодирования видео (каждый воркер заранее готовит аватар)
+        render_executor = RenderExecutor(RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_PER_USER, RENDER_WAIT_TIMEOUT,
+                                         initializer=preload_render)
+
+        # Кэш готовых ответов: повторяющиеся фразы не синтезируются и не загружаются заново
+        media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB * 1024 * 1024)
+
+        # Конвейер ответа: потоковый LLM -> TTS по предложениям -> сборка видеокружка
+        reply_pipeline = ReplyPipeline(render_executor, media_cache, tts_concurrency=PIPELINE_TTS_CONCURRENCY)
+
+        # Прогрев при старте: воркеры пула и готовые видеокружки приветствия и ответа при ошибке
+        warmup = Warmup(bot, render_executor, media_cache, WARMUP_PHRASES, WARMUP_CHAT_ID)
+        if WARMUP:
+            dp.startup.register(warmup.start)
+
+        RENDERS_IN_FLIGHT.set_function(lambda: render_executor.in_flight)
+        RENDER_QUEUE_DEPTH.set_function(lambda: render_executor.queue_depth)
+    app.router.add_get("/metrics", metrics_handler)
+
+    services = BotServices(bot, llm_client, storage, webhook_host, job_queue=job_queue, render_executor=render_executor,
+                           media_cache=media_cache, reply_pipeline=reply_pipeline, warmup=warmup)
+    dp["services"] = services
+    app[DISPATCHER] = dp
+    app[SERVICES] = services
+
+    # Настройка приложения
+    webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
+    webhook_requests_handler.register(app, path="/webhook")
+    setup_application(app, dp, bot=bot)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return app
 
 # Команда /start
-# Баланс в памяти (потом перенесём в БД)
-user_balances = {}
 START_CREDITS = 30
 
-@dp.message(CommandStart())
-async def cmd_start(message: Message):  # используем уже импортированный Message
-    user_id = message.from_user.id
-    if user_id not in user_balances:
-        user_balances[user_id] = START_CREDITS
+TOPUP_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Пополнить баланс", callback_data="topup")]
+])
 
-    balance = user_balances[user_id]
+async def cmd_start(message: Message, services: BotServices):  # используем уже импортированный Message
+    user_id = message.from_user.id
+    balance = await services.storage.ensure_user(user_id, START_CREDITS)
 
     welcome_text = (
         "Привет! Я твой личный видеособеседник!\n\n"
@@ -108,17 +165,13 @@ async def cmd_start(message: Message):  # используем уже импор
         "Пополни баланс и общайся без лимита!"
     )
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Пополнить баланс", callback_data="topup")]
-    ])
-
+    await send_canned(services, message, GREETING_PHRASE)
     await message.answer(
         text=f"{welcome_text}\n\nБаланс: {balance} кредитов",
-        reply_markup=keyboard
+        reply_markup=TOPUP_KEYBOARD
     )
 
 
-@dp.callback_query(F.data == "topup")
 async def callback_topup(callback: CallbackQuery):
     await callback.answer()  # убираем "часики"
 
@@ -131,253 +184,182 @@ async def callback_topup(callback: CallbackQuery):
     )
 
 
-@dp.message(Command("balance"))
-async def cmd_balance(message: Message):
-    balance = user_balances.get(message.from_user.id, 0)
+async def cmd_balance(message: Message, services: BotServices):
+    balance = await services.storage.get_balance(message.from_user.id)
     await message.answer(f"Ваш баланс: {balance} кредитов")
 # Обработка текстовых сообщений
-@dp.message()
-async def handle_message(message: Message, state: FSMContext):
+SYSTEM_PROMPT = "Ты дружелюбный виртуальный собеседник, молодая девушка, помнишь контекст, даешь советы, отвечай на русском."
+
+async def handle_message(message: Message, services: BotServices, turn: Turn = None):
+    new_trace()
     try:
         logging.info(f"Получено сообщение: {message.text}")
-        # Получение контекста из FSM
-        data = await state.get_data()
-        conversation = data.get('conversation', [])
+        user_id = message.from_user.id
+        # 1 видеоответ = 1 кредит; без оплаты (CREDITS_REQUIRED=0) баланс только учитывается
+        balance = await services.storage.ensure_user(user_id, START_CREDITS)
+        if CREDITS_REQUIRED and balance < 1:
+            await message.reply("Кредиты закончились. Пополни баланс, чтобы продолжить!", reply_markup=TOPUP_KEYBOARD)
+            return
+
+        # Контекст из хранилища: краткое содержание начала разговора + последние реплики
+        conversation = await services.storage.get_context(user_id)
 
         # Добавляем сообщение пользователя в контекст
         conversation.append({"role": "user", "content": message.text})
 
-        # Получение ответа от OpenRouter с контекстом
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "meta-llama/llama-3-70b-instruct",  # Новая модель
-                    "messages": [
-                        {"role": "system", "content": "Ты дружелюбный виртуальный собеседник, молодая девушка, помнишь контекст, даешь советы, отвечай на русском."}
-                    ] + conversation,
-                    "max_tokens": 150
-                }
-            ) as response:
-                if response.status != 200:
-                    response_text = await response.text()
-                    logging.error(f"Ошибка API: {response.status}, Ответ: {response_text}")
-                    raise Exception(f"Ошибка API: {response.status}: {response_text}")
-                data = await response.json()
-                ai_text = data['choices'][0]['message']['content']
-                logging.info(f"Ответ от OpenRouter: {ai_text}")
-
-        # Добавляем ответ бота в контекст
-        conversation.append({"role": "assistant", "content": ai_text})
-        await state.update_data(conversation=conversation)
-
-        # Удаляем смайлики для видео и аудио
-        clean_text = remove_emojis(ai_text)
-        logging.info(f"Текст без смайликов для видео/аудио: {clean_text}")
-
-        # Генерация аудио и длительности
-        audio_data, duration, audio_path = text_to_speech(clean_text)
-        # Генерация видео
-        video_data = create_animation(clean_text, duration, audio_path)
+        if services.job_queue is not None:
+            await enqueue_reply(services, message, conversation, turn)
+            return
+
+        # Потоковый ответ OpenRouter идёт в конвейер: TTS предложений стартует
+        # до завершения ответа, рендер выполняется в пуле процессов
+        try:
+            reply = await services.reply_pipeline.run(message.from_user.id, services.llm_client.stream([
+                {"role": "system", "content": SYSTEM_PROMPT}
+            ] + conversation, max_tokens=150))
+        except RenderRejected as e:
+            logging.warning(f"Рендер отклонён для {message.from_user.id}: {e}")
+            await message.reply(f"Подожди немного: {e}")
+            return
+        ai_text = reply.ai_text
+        # Дальше только отправка: более новое сообщение этот ответ уже не отменяет
+        if turn is not None:
+            turn.commit()
+
+        # Сохраняем обе реплики (в базу они попадут пачкой при ближайшем сбросе)
+        services.storage.add_turn(user_id, "user", message.text)
+        services.storage.add_turn(user_id, "assistant", ai_text)
+        logging.info(f"Кэш медиа: {services.media_cache.stats()}")
+
+        if reply.entry is None:
+            logging.warning(f"Видео не будет для {message.from_user.id}: {reply.rejected or 'нечего озвучивать'}")
+            await message.reply(f"{ai_text}\n\n(Видео не будет: {reply.rejected})" if reply.rejected else ai_text)
+            return
 
         # Отправка видеосообщения
         logging.info("Отправка видеосообщения...")
-        await message.reply_video_note(
-            BufferedInputFile(video_data, filename="video_note.mp4"),
-            duration=int(duration),
-            length=480,
-            supports_streaming=True
-        )
+        upload_started = time.perf_counter()
+        await send_video_note(message.reply_video_note, services.media_cache, reply.entry, reply.video_data)
+        reply.timings["upload"] = time.perf_counter() - upload_started
+        await services.storage.debit(user_id)
         logging.info("Видеосообщение отправлено")
+        log_timings(reply.timings)
         # Отправка оригинального текста с смайликами
         await message.reply(ai_text)
         logging.info("Текстовый ответ отправлен")
     except Exception as e:
         logging.error(f"Ошибка в handle_message: {str(e)}")
+        await send_canned(services, message, FALLBACK_PHRASE)
         await message.reply(f"Ой, что-то пошло не так: {str(e)}")
 
-# Команда /setwebhook (для ручной настройки)
-@dp.message(Command(commands=['setwebhook']))
-async def set_webhook_manual(message: Message):
-    webhook_url = f"https://{WEBHOOK_HOST}/webhook"
-    try:
-        await bot.delete_webhook()
-        await bot.set_webhook(webhook_url, allowed_updates=["message"])
-        await message.reply(f"Webhook установлен: {webhook_url}")
-        logging.info(f"Webhook вручную установлен: {webhook_url}")
-    except Exception as e:
-        logging.error(f"Ошибка установки webhook вручную: {str(e)}")
-        await message.reply(f"Не удалось установить webhook: {str(e)}")
+# Ответ через очередь: webhook-процесс получает текст от LLM, а TTS, кодирование
+# и отправку видеокружка (или готового из своего кэша медиа) выполняет render_worker.
+# Ключ задачи — чат и id сообщения, поэтому повторная доставка апдейта Telegram не порождает второй ответ.
+async def enqueue_reply(services: BotServices, message: Message, conversation: list, turn: Turn = None) -> None:
+    user_id = message.from_user.id
+    key = f"{message.chat.id}:{message.message_id}"
+    # Ключ занимается до запроса к LLM: повторная доставка во время потока ответа не дублирует ни LLM, ни историю
+    if not await asyncio.to_thread(services.job_queue.reserve, key):
+        logging.info(f"Повторная доставка сообщения {key}, ответ уже готовится")
+        return
 
-# Генерация аудио с gTTS с улучшенными настройками
-def text_to_speech(text: str, lang: str = 'ru') -> tuple[bytes, float, str]:
     try:
-        text = text.strip().encode('utf-8').decode('utf-8', errors='ignore')  # Очистка кодировки
-        tts = gTTS(text=text, lang=lang, slow=False, tld='co.uk')  # co.uk для более естественного голоса
-        audio_bytes = io.BytesIO()
-        tts.write_to_fp(audio_bytes)
-        audio_bytes.seek(0)
-        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_audio:
-            temp_audio.write(audio_bytes.read())
-            temp_audio_path = temp_audio.name
-        audio_bytes.seek(0)
-        # Точное измерение длительности с moviepy
-        audio_clip = AudioFileClip(temp_audio_path)
-        duration = audio_clip.duration
-        audio_clip.close()
-        logging.info(f"Аудио создано, реальная длительность: {duration} сек, путь: {temp_audio_path}")
-        return audio_bytes.read(), duration, temp_audio_path
-    except Exception as e:
-        logging.error(f"Ошибка генерации аудио: {str(e)}")
+        parts = [delta async for delta in services.llm_client.stream([
+            {"role": "system", "content": SYSTEM_PROMPT}
+        ] + conversation, max_tokens=150)]
+    except BaseException:
+        await asyncio.to_thread(services.job_queue.release, key)
         raise
+    ai_text = "".join(parts).strip()
+    clean_text = remove_emojis(ai_text)
+    logging.info(f"Ответ от OpenRouter: {ai_text}")
+    if turn is not None:
+        turn.commit()
+    services.storage.add_turn(user_id, "user", message.text)
+    services.storage.add_turn(user_id, "assistant", ai_text)
+
+    # Озвучивать нечего (ответ из смайликов и знаков): только текст, без задачи и списания кредита.
+    # Резерв ключа остаётся до очистки очереди и отсекает повторную доставку
+    if not speakable(clean_text):
+        logging.warning(f"Видео не будет для {user_id}: нечего озвучивать")
+        await message.reply(ai_text)
+        return
 
-# Разбиение текста на части для отображения
-def split_text_for_display(text: str, max_width: int, font: ImageFont.ImageFont) -> list:
-    words = text.split()
-    lines = []
-    current_line = []
-    current_width = 0
-    for word in words:
-        word_width = font.getlength(word + " ")
-        if current_width + word_width <= max_width:
-            current_line.append(word)
-            current_width += word_width
-        else:
-            lines.append(" ".join(current_line))
-            current_line = [word]
-            current_width = word_width
-    if current_line:
-        lines.append(" ".join(current_line))
-    return lines
-
-# Генерация анимации с пользовательской GIF (замедленная)
-def create_animation(text: str, duration: float, audio_path: str) -> bytes:
-    frames = []
-    width, height = 480, 480  # Убедитесь, что размер соответствует вашей GIF
-    num_frames = int(duration * 15)  # 15 FPS для замедления
-
-    # Загрузка GIF
+    payload = {"ai_text": ai_text, "clean_text": clean_text, "user_id": user_id,
+               "chat_id": message.chat.id, "reply_to": message.message_id}
+    if await asyncio.to_thread(services.job_queue.enqueue, key, payload):
+        logging.info(f"Задача рендера {key} поставлена в очередь, глубина {await asyncio.to_thread(services.job_queue.depth)}")
+
+# Заранее отрендеренный видеокружок фразы из прогрева; если он ещё не готов, ничего не отправляется.
+# В режиме очереди фраза ставится задачей: воркер рендера отправит её из своего кэша
+async def send_canned(services: BotServices, message: Message, phrase: str) -> bool:
     try:
-        gif = Image.open("assets/girl_gif3.gif")
-        gif_frames = []
-        try:
-            while True:
-                gif_frame = gif.copy()
-                gif_frame = gif_frame.convert("RGB")
-                if gif_frame.size != (width, height):
-                    gif_frame = gif_frame.resize((width, height), Image.Resampling.LANCZOS)
-                gif_frames.append(np.array(gif_frame))
-                gif.seek(gif.tell() + 1)
-        except EOFError:
-            pass
-        gif.close()
-    except FileNotFoundError:
-        logging.error("Файл assets/girl_gif3.gif не найден. Использую чёрный фон.")
-        gif_frames = [np.array(Image.new("RGB", (width, height), color=(0, 0, 0))) for _ in range(15)]
+        if services.job_queue is not None:
+            payload = {"canned": True, "clean_text": remove_emojis(phrase).strip(),
+                       "chat_id": message.chat.id, "reply_to": message.message_id}
+            key = f"{message.chat.id}:{message.message_id}:canned"
+            return await asyncio.to_thread(services.job_queue.enqueue, key, payload)
+        entry = services.warmup.entry(phrase)
+        if entry is None:
+            return False
+        await send_video_note(message.reply_video_note, services.media_cache, entry)
     except Exception as e:
-        logging.error(f"Ошибка загрузки GIF: {str(e)}")
-        gif_frames = [np.array(Image.new("RGB", (width, height), color=(0, 0, 0))) for _ in range(15)]
-
-    # Повторяем каждый кадр GIF для замедления (например, 2 раза)
-    slowed_gif_frames = []
-    for frame in gif_frames:
-        slowed_gif_frames.extend([frame] * 2)  # Повторяем каждый кадр дважды
-    gif_frames = slowed_gif_frames
-
-    # Повторяем GIF для соответствия длительности
-    gif_duration = len(gif_frames) / 15  # Длительность GIF в секундах (при 15 fps)
-    if gif_duration > 0:
-        repeat_count = max(1, int(duration / gif_duration))
-        full_frames = gif_frames * repeat_count
-        # Обрезаем или дополняем до нужной длительности
-        if len(full_frames) < num_frames:
-            full_frames.extend(gif_frames[:num_frames - len(full_frames)])
-        elif len(full_frames) > num_frames:
-            full_frames = full_frames[:num_frames]
-        frames = full_frames
-    else:
-        frames = [np.array(Image.new("RGB", (width, height), color=(0, 0, 0))) for _ in range(num_frames)]
-
-    # Создание видео с moviepy
-    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_video:
-        temp_video_path = temp_video.name
-        clip = ImageSequenceClip(frames, fps=15)
-        try:
-            audio_clip = AudioFileClip(audio_path)
-            clip = clip.set_audio(audio_clip)
-            if clip.duration < duration:
-                clip = clip.set_duration(duration)  # Убедимся, что видео не короче аудио
-            logging.info(f"Аудио прикреплено к видео: {audio_path}")
-        except Exception as e:
-            logging.error(f"Ошибка прикрепления аудио: {str(e)}")
-            clip = clip.set_duration(duration)
-        clip.write_videofile(temp_video_path, codec='libx264', audio_codec='aac', fps=15)
-        clip.close()
-        if clip.audio:
-            clip.audio.close()
-
-    # Чтение временного файла в BytesIO
-    video_bytes = io.BytesIO()
-    with open(temp_video_path, 'rb') as f:
-        video_bytes.write(f.read())
-    video_bytes.seek(0)
-
-    # Проверка размера файла
-    video_size = len(video_bytes.getvalue()) / (1024 * 1024)  # Размер в МБ
-    logging.info(f"Размер видео: {video_size:.2f} МБ")
-
-    # Удаление временных файлов
-    os.remove(temp_video_path)
-    os.remove(audio_path)
-    logging.info(f"Видео создано: {temp_video_path}, аудио удалено: {audio_path}")
-
-    return video_bytes.read()
-
-
-
-
-
+        logging.warning(f"Готовый видеокружок не отправлен: {str(e)}")
+        return False
+    return True
 
+# Команда /setwebhook (для ручной настройки)
+async def set_webhook_manual(message: Message, services: BotServices):
+    webhook_url = f"https://{services.webhook_host}/webhook"
+    try:
+        await services.bot.delete_webhook()
+        await services.bot.set_webhook(webhook_url, allowed_updates=["message"])
+        await message.reply(f"Webhook установлен: {webhook_url}")
+        logging.info(f"Webhook вручную установлен: {webhook_url}")
+    except Exception as e:
+        logging.error(f"Ошибка установки webhook вручную: {str(e)}")
+        await message.reply(f"Не удалось установить webhook: {str(e)}")
 
-# Webhook setup
-async def on_startup() -> None:
-    webhook_url = f"https://{WEBHOOK_HOST}/webhook"
+# Webhook setup: при нескольких копиях процесса webhook ставится только если он ещё не указывает
+# на нужный адрес, поэтому копии не сбрасывают его друг другу (SET_WEBHOOK=0 отключает совсем)
+async def on_startup(services: BotServices) -> None:
+    if not SET_WEBHOOK:
+        return
+    webhook_url = f"https://{services.webhook_host}/webhook"
     logging.info(f"Попытка установить webhook: {webhook_url}")
     try:
-        await bot.delete_webhook()
-        await bot.set_webhook(webhook_url, allowed_updates=["message"])
+        info = await services.bot.get_webhook_info()
+        if info.url == webhook_url:
+            logging.info(f"Webhook уже установлен: {webhook_url}")
+            return
+        await services.bot.set_webhook(webhook_url, allowed_updates=["message"])
         logging.info(f"Webhook успешно установлен: {webhook_url}")
     except Exception as e:
         logging.error(f"Ошибка установки webhook: {str(e)}")
         raise
 
-# Настройка приложения
-webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
-webhook_requests_handler.register(app, path="/webhook")
-setup_application(app, dp, bot=bot)
-dp.startup.register(on_startup)
+
+async def on_shutdown(services: BotServices) -> None:
+    if services.job_queue is not None:
+        services.job_queue.close()
+    else:
+        await services.warmup.stop()
+        services.render_executor.shutdown()
+
+
+# Роутер с обработчиками бота; порядок регистрации — порядок проверки фильтров
+def create_router() -> Router:
+    router = Router()
+    router.message.register(cmd_start, CommandStart())
+    router.callback_query.register(callback_topup, F.data == "topup")
+    router.message.register(cmd_balance, Command("balance"))
+    router.message.register(handle_message, flags={"user_flow": True})
+    router.message.register(set_webhook_manual, Command(commands=['setwebhook']))
+    return router
 
 
 if __name__ == '__main__':
+    app = create_app()
     port = int(os.environ.get('PORT', 10000))
     logging.info(f"Запуск сервера на порту {port}")
     web.run_app(app, host='0.0.0.0', port=port)
-
-# Добавьте в конец файла
-async def set_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Укажите ваш пол: мужской или женский")
-    context.user_data['waiting_for_gender'] = True
-
-async def handle_gender(message: Message, state: FSMContext):
-    if state.user_data.get('waiting_for_gender'):
-        gender = message.text.lower()
-        if gender in ['мужской', 'женский']:
-            state.user_data['gender'] = gender
-            await message.reply("Пол сохранён!")
-            state.user_data['waiting_for_gender'] = False
-        else:
-            await message.reply("Неверный ввод. Попробуйте снова.")
@@ -0,0 +1,180 @@
+import logging
+import numpy as np
+from PIL import Image, ImageDraw
+
+from avatar_cache import AVATAR_SIZE, AVATAR_SLOWDOWN, load_avatar, frame_indices
+
+CHUNK_FRAMES = 32  # кадров в одном буфере, который уходит в pipe ffmpeg
+SUBTITLE_STROKE = 2
+SUBTITLE_LINES = 2  # строк субтитров на одном экране
+
+
+# Субтитр, растеризованный один раз: цвет, умноженный на альфу, и 255 - альфа (uint16),
+# обрезанные по рамке текста; наложение на кадры — две операции NumPy на всю пачку
+class Caption:
+    def __init__(self, color_alpha: np.ndarray, inverse_alpha: np.ndarray, x: int, y: int):
+        self.color_alpha = color_alpha
+        self.inverse_alpha = inverse_alpha
+        self.x = x
+        self.y = y
+
+    @property
+    def height(self) -> int:
+        return self.inverse_alpha.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.inverse_alpha.shape[1]
+
+    def blend(self, frames: np.ndarray) -> None:
+        region = frames[:, self.y:self.y + self.height, self.x:self.x + self.width]
+        region[:] = ((region * self.inverse_alpha + self.color_alpha) // 255).astype(np.uint8)
+
+
+# Растеризация строк субтитра: белый текст с чёрной обводкой, по центру по горизонтали,
+# нижний край на уровне bottom (видеокружок обрезается по кругу, поэтому не у самого края)
+def rasterize_caption(lines: list, font, frame_size: tuple = AVATAR_SIZE, bottom: float = 0.82) -> Caption:
+    width, height = frame_size
+    font_size = getattr(font, "size", 11)
+    line_height = int(font_size * 1.25)
+    text = "\n".join(lines)
+    box_height = line_height * len(lines) + 2 * SUBTITLE_STROKE
+    outline = Image.new("L", (width, box_height), 0)
+    fill = Image.new("L", (width, box_height), 0)
+    position = (SUBTITLE_STROKE, SUBTITLE_STROKE)
+    options = {"font": font, "align": "center", "spacing": line_height - font_size}
+    ImageDraw.Draw(outline).multiline_text(position, text, fill=255, stroke_width=SUBTITLE_STROKE,
+                                           stroke_fill=255, **options)
+    ImageDraw.Draw(fill).multiline_text(position, text, fill=255, **options)
+
+    alpha = np.maximum(np.asarray(outline), np.asarray(fill)).astype(np.uint16)
+    # Белая заливка поверх чёрной обводки: цвет = доля заливки в общей альфе
+    color = (np.asarray(fill).astype(np.uint16) * 255) // np.maximum(alpha, 1)
+    rows, cols = np.nonzero(alpha)
+    if len(rows) == 0:
+        return None
+    y0, y1, x0, x1 = rows.min(), rows.max() + 1, cols.min(), cols.max() + 1
+    y1 = min(y1, y0 + height)  # слишком высокий субтитр обрезается по кадру
+    alpha, color = alpha[y0:y1, x0:x1, None], color[y0:y1, x0:x1, None]
+    top = max(0, min(height - (y1 - y0), int(height * bottom) - box_height + y0))
+    return Caption(color * alpha, 255 - alpha, (width - (x1 - x0)) // 2, top)
+
+
+# Расписание субтитров: строки группируются по SUBTITLE_LINES, время экрана
+# пропорционально числу символов (темп речи TTS почти равномерный)
+def caption_schedule(lines: list, font, num_frames: int, frame_size: tuple = AVATAR_SIZE) -> list:
+    pages = [lines[i:i + SUBTITLE_LINES] for i in range(0, len(lines), SUBTITLE_LINES)]
+    pages = [page for page in pages if any(line.strip() for line in page)]
+    if not pages or num_frames <= 0:
+        return []
+    weights = np.cumsum([sum(len(line) for line in page) for page in pages], dtype=np.float64)
+    bounds = np.concatenate([[0], np.round(weights / weights[-1] * num_frames)]).astype(int)
+    schedule = []
+    for page, start, end in zip(pages, bounds[:-1], bounds[1:]):
+        caption = rasterize_caption(page, font, frame_size)
+        if caption is not None and end > start:
+            schedule.append((int(start), int(end), caption))
+    return schedule
+
+
+# Огибающая громкости по кадрам видео: RMS окна в 1/fps секунды, за один векторный проход,
+# нормирована к 0..1 по громким участкам речи
+def rms_envelope(pcm: bytes, sample_rate: int, num_frames: int, fps: int) -> np.ndarray:
+    source = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+    window = max(1, int(round(sample_rate / fps)))
+    samples = np.zeros(num_frames * window, dtype=np.float32)
+    count = min(len(source), len(samples))
+    samples[:count] = source[:count]
+    rms = np.sqrt(np.mean(samples.reshape(num_frames, window) ** 2, axis=1))
+    rms = np.convolve(rms, [0.25, 0.5, 0.25], mode="same")  # сглаживание дрожания между кадрами
+    peak = np.percentile(rms, 95) if len(rms) else 0
+    return np.clip(rms / peak, 0, 1) if peak > 0 else np.zeros(num_frames, np.float32)
+
+
+# Спрайты рта: горизонтальная полоса RGBA из levels кадров, от закрытого к открытому.
+# Спрайт у края обрезается по кадру; спрайт целиком вне кадра — ошибка при загрузке
+class MouthSprites:
+    def __init__(self, path: str, position: tuple, levels: int = None, frame_size: tuple = AVATAR_SIZE):
+        with Image.open(path) as image:
+            strip = np.asarray(image.convert("RGBA"))
+        levels = levels or max(1, strip.shape[1] // strip.shape[0])
+        width = strip.shape[1] // levels
+        sprites = strip[:, :width * levels].reshape(strip.shape[0], levels, width, 4).transpose(1, 0, 2, 3)
+        x, y = position
+        left, top = max(0, -x), max(0, -y)
+        right, bottom = min(width, frame_size[0] - x), min(strip.shape[0], frame_size[1] - y)
+        if right <= left or bottom <= top:
+            raise ValueError(f"спрайт рта {width}x{strip.shape[0]} в точке {x},{y} не попадает в кадр "
+                             f"{frame_size[0]}x{frame_size[1]}")
+        if (right - left, bottom - top) != (width, strip.shape[0]):
+            logging.warning(f"Спрайт рта в точке {x},{y} выходит за кадр и обрезан до {right - left}x{bottom - top}")
+        sprites = sprites[:, top:bottom, left:right]
+        alpha = sprites[..., 3:].astype(np.uint16)
+        self.color_alpha = sprites[..., :3].astype(np.uint16) * alpha
+        self.inverse_alpha = 255 - alpha
+        self.levels = levels
+        self.x, self.y = x + left, y + top
+
+    def blend(self, frames: np.ndarray, levels: np.ndarray) -> None:
+        height, width = self.inverse_alpha.shape[1:3]
+        region = frames[:, self.y:self.y + height, self.x:self.x + width]
+        region[:] = ((region * self.inverse_alpha[levels] + self.color_alpha[levels]) // 255).astype(np.uint8)
+
+
+# Индексы кадров аватара, которые продвигаются только пока звучит речь: на паузах кадр замирает
+def gated_indices(source_frames: int, envelope: np.ndarray, threshold: float = 0.15,
+                  slowdown: int = AVATAR_SLOWDOWN) -> np.ndarray:
+    voiced = (envelope > threshold).astype(np.int64)
+    return (np.cumsum(voiced) // slowdown) % source_frames
+
+
+# Покадровый композитор: кадры аватара копируются пачками в переиспользуемый буфер,
+# поверх накладываются заранее растеризованные субтитры и спрайт рта по огибающей.
+# Пачки отдаются генератором прямо в stdin ffmpeg — весь ролик в памяти не держится.
+class Compositor:
+    def __init__(self, num_frames: int, captions: list = (), envelope: np.ndarray = None,
+                 sprites: MouthSprites = None, avatar_path: str = None):
+        self.avatar = load_avatar(avatar_path) if avatar_path else load_avatar()
+        self.num_frames = num_frames
+        self.captions = list(captions)
+        self.sprites = sprites
+        self.levels = None
+        if envelope is not None and sprites is not None:
+            self.levels = np.minimum((envelope * sprites.levels).astype(np.int64), sprites.levels - 1)
+            self.indices = frame_indices(len(self.avatar), num_frames)
+        elif envelope is not None:
+            self.indices = gated_indices(len(self.avatar), envelope)
+        else:
+            self.indices = frame_indices(len(self.avatar), num_frames)
+
+    # buffer — заранее выделенный массив (кадры x H x W x 3), который можно переиспользовать между ответами
+    def chunks(self, chunk_frames: int = CHUNK_FRAMES, buffer: np.ndarray = None):
+        if buffer is None or buffer.shape[1:] != self.avatar.shape[1:]:
+            buffer = np.empty((min(chunk_frames, max(1, self.num_frames)),) + self.avatar.shape[1:], dtype=np.uint8)
+        for start in range(0, self.num_frames, len(buffer)):
+            end = min(start + len(buffer), self.num_frames)
+            frames = buffer[:end - start]
+            np.take(self.avatar, self.indices[start:end], axis=0, out=frames)
+            for caption_start, caption_end, caption in self.captions:
+                lo, hi = max(start, caption_start), min(end, caption_end)
+                if lo < hi:
+                    caption.blend(frames[lo - start:hi - start])
+            if self.levels is not None:
+                self.sprites.blend(frames, self.levels[start:end])
+            yield frames  # буфер переиспользуется: ffmpeg дочитывает пачку до следующего шага
+
+
+_sprites = {}
+
+
+# Спрайты рта загружаются один раз на процесс
+def load_mouth_sprites(path: str, position: str) -> MouthSprites:
+    if path not in _sprites:
+        try:
+            x, y = (int(value) for value in position.split(","))
+            _sprites[path] = MouthSprites(path, (x, y))
+            logging.info(f"Спрайты рта загружены: {path}, {_sprites[path].levels} уровней")
+        except Exception as e:
+            logging.error(f"Не удалось загрузить спрайты рта {path}: {str(e)}")
+            _sprites[path] = None
+    return _sprites[path]
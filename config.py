@@ -1,12 +1,123 @@
 import os
 from dotenv import load_dotenv
 
-# Загрузка переменных окружения из .env
+# Загрузка переменных окружения из .env — единственное место: все настройки ниже читаются при импорте
 load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")
 
+# Пул рендера: число процессов, размер очереди, лимит на пользователя,
+# сколько секунд задача может ждать свободный слот
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "8"))
+RENDER_PER_USER = int(os.getenv("RENDER_PER_USER", "1"))
+RENDER_WAIT_TIMEOUT = float(os.getenv("RENDER_WAIT_TIMEOUT", "30"))
 
+# Поток сообщений пользователя: пауза, за которую серия сообщений склеивается в один ход
+# (сек), и ведро токенов на ходы — пополнение в минуту и запас (при CREDITS_REQUIRED=1 не больше баланса).
+# USER_FLOW=0 отключает склейку, отмену устаревших ответов и лимит
+USER_FLOW = os.getenv("USER_FLOW", "1") == "1"
+USER_DEBOUNCE = float(os.getenv("USER_DEBOUNCE", "0.8"))
+USER_TURNS_PER_MINUTE = float(os.getenv("USER_TURNS_PER_MINUTE", "6"))
+USER_TURNS_BURST = int(os.getenv("USER_TURNS_BURST", "3"))
 
+# Кредиты: списание за каждый видеоответ ведётся всегда, а отказ в ответе при нулевом балансе
+# и лимит ходов по балансу включаются только вместе с оплатой (CREDITS_REQUIRED=1)
+CREDITS_REQUIRED = os.getenv("CREDITS_REQUIRED", "0") == "1"
+
+# Аватар и каталог для предрасчитанных кадров (.npy)
+AVATAR_PATH = os.getenv("AVATAR_PATH", "assets/girl_gif3.gif")
+AVATAR_CACHE_DIR = os.getenv("AVATAR_CACHE_DIR", "cache")
+
+# Профиль кодирования видеокружка (fast, balanced, small — см. encoder.PROFILES; пусто — по режиму
+# рендера: small для цикла аватара, balanced для покадрового) и число потоков x264 на один процесс
+# рендера (по умолчанию ядра делятся поровну между воркерами)
+ENCODE_PROFILE = os.getenv("ENCODE_PROFILE", "")
+ENCODE_THREADS = int(os.getenv("ENCODE_THREADS", max(1, (os.cpu_count() or 1) // RENDER_WORKERS)))
+
+# Рендерер видеокружка: "animation" — create_animation (режим задаёт RENDER_MODE),
+# "improved" — ImprovedVideoGenerator (покадрово, всегда с субтитрами, буфер кадров на процесс)
+VIDEO_RENDERER = os.getenv("VIDEO_RENDERER", "animation")
+
+# Режим рендера видео: "segments" — готовый цикл аватара + копирование потока,
+# "frames" — покадровое кодирование через pipe; AVATAR_SEGMENT_GOP — интервал ключевых кадров цикла
+RENDER_MODE = os.getenv("RENDER_MODE", "segments")
+AVATAR_SEGMENT_GOP = int(os.getenv("AVATAR_SEGMENT_GOP", "15"))
+
+# Кэш готовых ответов (mp3 + mp4) и его предельный размер
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "cache/media")
+MEDIA_CACHE_MAX_MB = int(os.getenv("MEDIA_CACHE_MAX_MB", "200"))
+
+# Прогрев при старте: воркеры рендера, пробное кодирование и заранее готовые видеокружки
+# для частых фраз (приветствие, ответ при ошибке, дополнительные фразы через "|").
+# WARMUP_CHAT_ID — служебный чат, куда ролики загружаются один раз ради file_id.
+# При RENDER_BACKEND=queue фразы готовит каждый render_worker.py в своём кэше медиа
+WARMUP = os.getenv("WARMUP", "1") == "1"
+GREETING_PHRASE = os.getenv("GREETING_PHRASE", "Привет! Я твой личный видеособеседник. Напиши мне что-нибудь!")
+FALLBACK_PHRASE = os.getenv("FALLBACK_PHRASE", "Ой, что-то пошло не так… Попробуй написать ещё раз.")
+WARMUP_PHRASES = [GREETING_PHRASE, FALLBACK_PHRASE] + [
+    phrase.strip() for phrase in os.getenv("WARMUP_PHRASES", "").split("|") if phrase.strip()]
+WARMUP_CHAT_ID = os.getenv("WARMUP_CHAT_ID", "")
+
+# OpenRouter: адрес API, модель, таймауты (сек), число повторов и размер пула соединений
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "meta-llama/llama-3-70b-instruct")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+
+# Сколько предложений одного ответа озвучиваются параллельно
+PIPELINE_TTS_CONCURRENCY = int(os.getenv("PIPELINE_TTS_CONCURRENCY", "3"))
+
+# TTS: движки в порядке приоритета (gtts, piper; fixed — заглушка для бенчмарков),
+# язык и домен gTTS, таймаут запроса (сек), путь к ONNX-модели Piper для локального синтеза.
+# Если модель Piper задана, по умолчанию она служит запасным движком при сбое gTTS
+PIPER_MODEL = os.getenv("PIPER_MODEL", "")
+TTS_ENGINES = os.getenv("TTS_ENGINES", "gtts,piper" if PIPER_MODEL else "gtts")
+TTS_LANG = os.getenv("TTS_LANG", "ru")
+TTS_TLD = os.getenv("TTS_TLD", "co.uk")  # co.uk для более естественного голоса
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "10"))
+
+# Хранилище (SQLite): путь к базе, бюджет токенов окна истории и краткого содержания,
+# интервал пакетной записи реплик (сек)
+STORAGE_PATH = os.getenv("STORAGE_PATH", "data/bot.sqlite3")
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1500"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+STORAGE_FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", "1"))
+
+# Где рендерить ответы: "pool" — пул процессов внутри webhook-процесса,
+# "queue" — очередь задач (SQLite) и отдельные процессы render_worker.py
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "pool")
+
+# Очередь задач рендера: путь к базе, аренда задачи (сек), число попыток,
+# период опроса очереди воркером (сек) и число процессов render_worker.py;
+# завершённые задачи хранятся JOB_RETENTION сек и удаляются раз в JOB_PRUNE_INTERVAL сек
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "data/jobs.sqlite3")
+JOB_LEASE = float(os.getenv("JOB_LEASE", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "86400"))
+JOB_PRUNE_INTERVAL = float(os.getenv("JOB_PRUNE_INTERVAL", "3600"))
+RENDER_WORKER_PROCESSES = int(os.getenv("RENDER_WORKER_PROCESSES", os.cpu_count() or 1))
+
+# Устанавливать ли webhook при старте (на копиях webhook-процесса можно выключить: SET_WEBHOOK=0)
+SET_WEBHOOK = os.getenv("SET_WEBHOOK", "1") == "1"
+
+# Наблюдаемость: логировать спаны запроса с trace id (TRACE_SPANS=1), доля рендеров
+# под cProfile (0 — выключено) и каталог для .prof-файлов
+TRACE_SPANS = os.getenv("TRACE_SPANS", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "cache/profiles")
+
+# Композитинг кадров (включает покадровый рендер вместо цикла аватара): субтитры и их размер
+# шрифта, анимация рта по громкости речи (LIPSYNC=1). Спрайты рта — PNG-полоса RGBA из кадров
+# от закрытого к открытому и позиция её левого верхнего угла "x,y"; без спрайтов аватар
+# анимируется только пока звучит речь.
+SUBTITLES = os.getenv("SUBTITLES", "0") == "1"
+SUBTITLE_FONT_SIZE = int(os.getenv("SUBTITLE_FONT_SIZE", "26"))
+LIPSYNC = os.getenv("LIPSYNC", "0") == "1"
+MOUTH_SPRITES = os.getenv("MOUTH_SPRITES", "")
+MOUTH_POSITION = os.getenv("MOUTH_POSITION", "200,300")
@@ -0,0 +1,41 @@
+import time
+import logging
+from aiogram.types import BufferedInputFile, Message
+from aiogram.exceptions import TelegramBadRequest
+
+from media_cache import MediaCache, CachedMedia
+from metrics import UPLOAD_SECONDS, STAGE_ERRORS, span
+from render import VIDEO_SIZE
+
+
+# Отправка видеокружка из кэша медиа: по сохранённому file_id без повторной загрузки,
+# иначе загрузка файла и запоминание его file_id. send — метод отправки с уже заданным
+# адресатом: message.reply_video_note в webhook-процессе или
+# functools.partial(bot.send_video_note, chat_id, reply_to_message_id=...) в воркере очереди
+async def send_video_note(send, cache: MediaCache, entry: CachedMedia, video_data: bytes = None) -> Message:
+    started = time.perf_counter()
+    if entry.file_id:
+        try:
+            with span("upload", source="file_id"):
+                sent = await send(entry.file_id, duration=int(entry.duration), length=VIDEO_SIZE)
+            UPLOAD_SECONDS.observe(time.perf_counter() - started, source="file_id")
+            return sent
+        except TelegramBadRequest as e:
+            logging.warning(f"file_id из кэша не принят: {str(e)}")
+            cache.drop_file_id(entry.key)
+    if video_data is None:
+        video_data = cache.read_video(entry.key)
+    try:
+        with span("upload", source="upload", bytes=len(video_data)):
+            sent = await send(
+                BufferedInputFile(video_data, filename="video_note.mp4"),
+                duration=int(entry.duration),
+                length=VIDEO_SIZE
+            )
+    except Exception:
+        STAGE_ERRORS.inc(stage="upload")
+        raise
+    UPLOAD_SECONDS.observe(time.perf_counter() - started, source="upload")
+    if sent.video_note:
+        cache.set_file_id(entry.key, sent.video_note.file_id)
+    return sent
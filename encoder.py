@@ -0,0 +1,168 @@
+import os
+import logging
+import tempfile
+import threading
+import warnings
+import subprocess
+
+from config import ENCODE_PROFILE, ENCODE_THREADS
+
+# Фрагментированный MP4 можно писать в pipe: moov в начале, без перемотки выхода
+FRAGMENTED_MP4 = ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"]
+
+
+# Профиль кодирования видеокружка: пресет и tune x264, CRF, интервал ключевых кадров (сек),
+# моно AAC с низким битрейтом (речь TTS)
+class EncodeProfile:
+    def __init__(self, name: str, preset: str, tune: str, crf: int, keyint_seconds: float,
+                 audio_bitrate: str = "48k", audio_rate: int = 24000):
+        self.name = name
+        self.preset = preset
+        self.tune = tune
+        self.crf = crf
+        self.keyint_seconds = keyint_seconds
+        self.audio_bitrate = audio_bitrate
+        self.audio_rate = audio_rate
+
+    def video_args(self, fps: int, threads: int = ENCODE_THREADS, keyint: int = None) -> list:
+        keyint = keyint or max(1, int(self.keyint_seconds * fps))
+        return ["-c:v", "libx264", "-preset", self.preset, "-tune", self.tune, "-crf", str(self.crf),
+                "-g", str(keyint), "-pix_fmt", "yuv420p", "-threads", str(threads)]
+
+    def audio_args(self) -> list:
+        return ["-c:a", "aac", "-ac", "1", "-ar", str(self.audio_rate), "-b:a", self.audio_bitrate]
+
+
+# fast — минимальная задержка, small — минимальный размер. По benchmarks/bench_encode_profiles.py
+# для сборки из цикла аватара small и быстрее, и втрое меньше прежних настроек (AAC моно 32k),
+# для покадрового кодирования balanced вдвое быстрее small при размере на 40% меньше прежнего
+PROFILES = {
+    "fast": EncodeProfile("fast", "ultrafast", "animation", 30, 5, "48k"),
+    "balanced": EncodeProfile("balanced", "veryfast", "animation", 28, 10, "48k"),
+    "small": EncodeProfile("small", "medium", "stillimage", 32, 20, "32k", audio_rate=22050),
+}
+
+
+def get_profile(name: str = None) -> EncodeProfile:
+    return PROFILES[name or ENCODE_PROFILE or "balanced"]
+
+
+# Бинарник ffmpeg тот же, что использует moviepy (системный или из imageio-ffmpeg);
+# moviepy импортируется только при первом запуске ffmpeg, webhook-процессу он не нужен
+def ffmpeg_binary() -> str:
+    warnings.filterwarnings("ignore", category=SyntaxWarning)  # предупреждения о синтаксисе в moviepy
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+
+def _ffmpeg_error(returncode: int, stderr: bytes) -> RuntimeError:
+    stderr = stderr.decode("utf-8", errors="ignore").strip()
+    logging.error(f"Ошибка ffmpeg ({returncode}): {stderr}")
+    return RuntimeError(f"ffmpeg завершился с кодом {returncode}: {stderr}")
+
+
+# Запуск ffmpeg с аргументами; при ошибке — исключение с выводом stderr
+def run_ffmpeg(args: list, input: bytes = None, pass_fds: tuple = ()) -> bytes:
+    cmd = [ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(cmd, input=input, capture_output=True, pass_fds=pass_fds)
+    if result.returncode != 0:
+        raise _ffmpeg_error(result.returncode, result.stderr)
+    return result.stdout
+
+
+# Запуск ffmpeg с потоковой подачей stdin из отдельного потока;
+# stdout читается целиком в bytes и отдаётся без промежуточных копий.
+# Ошибка источника кадров останавливает ffmpeg и пробрасывается вызывающему:
+# иначе закрытый stdin дал бы ffmpeg дописать усечённый ролик с кодом 0
+def stream_ffmpeg(args: list, chunks, pass_fds: tuple = ()) -> bytes:
+    cmd = [ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"] + args
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            pass_fds=pass_fds)
+    stderr = []
+    errors = []
+
+    def write_input():
+        try:
+            for chunk in chunks:
+                try:
+                    proc.stdin.write(chunk)
+                except BrokenPipeError:
+                    return  # ffmpeg завершился раньше (например, по -t); ошибку покажет код возврата
+        except BaseException as e:
+            errors.append(e)
+            proc.kill()
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    writer = threading.Thread(target=write_input, daemon=True)
+    reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+    writer.start()
+    reader.start()
+    output = proc.stdout.read()
+    proc.wait()
+    writer.join()
+    reader.join()
+    if errors:
+        raise errors[0]
+    if proc.returncode != 0:
+        raise _ffmpeg_error(proc.returncode, b"".join(stderr))
+    return output
+
+
+# Аудио в анонимном файле в памяти (memfd); ffmpeg читает его как /dev/fd/N.
+# Без memfd — безымянный временный файл, который удаляется при закрытии.
+def audio_fd(audio: bytes) -> int:
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("tts_audio")
+    else:
+        with tempfile.TemporaryFile() as f:
+            fd = os.dup(f.fileno())
+    view = memoryview(audio)
+    while view:
+        view = view[os.write(fd, view):]
+    os.lseek(fd, 0, os.SEEK_SET)
+    return fd
+
+
+# Декодирование аудио в моно PCM s16le через pipe, без файлов
+def decode_pcm(audio: bytes, sample_rate: int, input_args: list = ()) -> bytes:
+    return run_ffmpeg(list(input_args) + ["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+                      input=audio)
+
+
+# Кодирование видеокружка: сырые RGB-кадры идут в stdin, аудио (tts.Speech) — через memfd,
+# фрагментированный MP4 читается из stdout
+def encode_video_note(frames, speech, fps: int = 15, size: tuple = (480, 480), profile: EncodeProfile = None) -> bytes:
+    profile = profile or get_profile()
+    fd = audio_fd(speech.data)
+    try:
+        return stream_ffmpeg([
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "pipe:0",
+        ] + speech.input_args() + [
+            "-i", f"/dev/fd/{fd}",
+            "-map", "0:v", "-map", "1:a",
+        ] + profile.video_args(fps) + profile.audio_args() + [
+            "-t", f"{speech.duration:.3f}",
+        ] + FRAGMENTED_MP4 + ["pipe:1"], (memoryview(frame) for frame in frames), pass_fds=(fd,))
+    finally:
+        os.close(fd)
+
+
+# Сборка видеокружка из готового видеофайла копированием потока; кодируется только аудио
+def mux_video_note(video_path: str, speech, loop: bool = True, profile: EncodeProfile = None) -> bytes:
+    profile = profile or get_profile()
+    fd = audio_fd(speech.data)
+    try:
+        return run_ffmpeg((["-stream_loop", "-1"] if loop else []) + [
+            "-i", video_path,
+        ] + speech.input_args() + [
+            "-i", f"/dev/fd/{fd}",
+            "-map", "0:v", "-map", "1:a", "-c:v", "copy",
+        ] + profile.audio_args() + [
+            "-t", f"{speech.duration:.3f}",
+        ] + FRAGMENTED_MP4 + ["pipe:1"], pass_fds=(fd,))
+    finally:
+        os.close(fd)
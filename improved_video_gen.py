@@ -1,39 +1,69 @@
-import cv2
-     import numpy as np
-     import logging
-     from PIL import Image, ImageDraw, ImageFont
-
-     class ImprovedVideoGenerator:
-         def __init__(self, width=480, height=480, fps=30):
-             self.width = width
-             self.height = height
-             self.fps = fps
-             logging.basicConfig(level=logging.INFO)
-
-         def generate_video(self, text, audio_path, output_path):
-             try:
-                 # Создание видео
-                 fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                 out = cv2.VideoWriter(output_path, fourcc, self.fps, (self.width, self.height))
-
-                 # Генерация градиента (пример)
-                 for frame_num in range(int(self.fps * 5)):  # 5 секунд
-                     frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-                     # Градиент от чёрного к белому (0-255)
-                     r = min(255, int(255 * frame_num / (self.fps * 5)))  # Ограничение до 255
-                     frame[:, :] = (r, r, r)  # Серый градиент
-                     # Добавление текста
-                     font = cv2.FONT_HERSHEY_SIMPLEX
-                     cv2.putText(frame, text[:20], (50, self.height // 2), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
-                     out.write(frame)
-                     logging.debug(f"Frame {frame_num} generated with color {r}")
-
-                 out.release()
-                 logging.info(f"Video saved to {output_path}")
-             except Exception as e:
-                 logging.error(f"Video generation failed: {str(e)}")
-                 raise
-
-     if __name__ == "__main__":
-         generator = ImprovedVideoGenerator()
-         generator.generate_video("Test text", "audio.mp3", "output.mp4")
+import os
+import sys
+import math
+import time
+import logging
+import numpy as np
+
+from avatar_cache import AVATAR_SIZE
+from compositor import CHUNK_FRAMES
+from encoder import EncodeProfile, encode_video_note, get_profile, decode_pcm
+from metrics import ENCODE_SECONDS, VIDEO_BYTES, STAGE_ERRORS
+from render import VIDEO_FPS, composite_frames, remove_emojis
+from tts import Speech
+
+
+# Рендерер видеокружка: кадры аватара с субтитрами собираются в один заранее выделенный
+# буфер, который живёт всё время жизни генератора, и пачками идут в stdin ffmpeg;
+# аудио передаётся через memfd, MP4 читается из stdout — файлов на диске нет.
+# Длина ролика — ровно длительность аудио (кадров с запасом вверх, обрезка по -t).
+class ImprovedVideoGenerator:
+    name = "improved"
+
+    def __init__(self, width: int = AVATAR_SIZE[0], height: int = AVATAR_SIZE[1], fps: int = VIDEO_FPS,
+                 profile: EncodeProfile = None, subtitles: bool = True, chunk_frames: int = CHUNK_FRAMES):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.profile = profile
+        self.subtitles = subtitles
+        self.buffer = np.empty((chunk_frames, height, width, 3), dtype=np.uint8)
+
+    def num_frames(self, duration: float) -> int:
+        return max(1, math.ceil(duration * self.fps))
+
+    def render(self, text: str, speech: Speech) -> bytes:
+        started = time.perf_counter()
+        frames = composite_frames(remove_emojis(text).strip(), speech, self.num_frames(speech.duration),
+                                  subtitles=self.subtitles, buffer=self.buffer)
+        try:
+            video_data = encode_video_note(frames, speech, fps=self.fps, size=(self.width, self.height),
+                                           profile=self.profile or get_profile())
+        except Exception:
+            STAGE_ERRORS.inc(stage="encode")
+            raise
+        ENCODE_SECONDS.observe(time.perf_counter() - started, mode=self.name)
+        VIDEO_BYTES.observe(len(video_data))
+        logging.info(f"Видео создано ({self.name}): {len(video_data) / (1024 * 1024):.2f} МБ, {speech.duration:.2f} сек")
+        return video_data
+
+    # Совместимость с прежним интерфейсом: аудиофайл на входе, mp4 на выходе
+    def generate_video(self, text: str, audio_path: str, output_path: str) -> None:
+        with open(audio_path, "rb") as f:
+            audio = f.read()
+        sample_rate = 24000
+        speech = Speech(decode_pcm(audio, sample_rate), sample_rate)
+        video_data = self.render(text, speech)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(video_data)
+        os.replace(tmp_path, output_path)
+        logging.info(f"Видео сохранено в {output_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if len(sys.argv) < 3:
+        sys.exit("Использование: python improved_video_gen.py audio.mp3 output.mp4 [текст]")
+    generator = ImprovedVideoGenerator()
+    generator.generate_video(sys.argv[3] if len(sys.argv) > 3 else "Тестовый текст", sys.argv[1], sys.argv[2])
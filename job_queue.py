@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    worker TEXT,
+    error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+
+
+# Задача рендера, выданная воркеру
+class Job:
+    def __init__(self, id: int, key: str, payload: dict, attempts: int):
+        self.id = id
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+
+
+# Очередь задач рендера в SQLite (WAL) для одного узла: webhook-процесс ставит задачи,
+# процессы render_worker забирают их под аренду (lease) и подтверждают выполнение.
+# Ключ идемпотентности уникален: повторная доставка того же апдейта не создаёт вторую задачу.
+# Ключ резервируется (status = 'reserved') ещё до запроса к LLM, поэтому апдейт, доставленный
+# повторно, пока первый ждёт ответа, тоже отсекается; воркерам выдаются только задачи 'queued'.
+# Задача, чья аренда истекла (воркер упал), снова выдаётся; после max_attempts — failed,
+# иначе задача, которая роняет воркер, выдавалась бы бесконечно.
+class JobQueue:
+    def __init__(self, path: str, lease: float = 120, max_attempts: int = 3, backoff: float = 2.0):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()  # соединение общее для потоков event loop (asyncio.to_thread)
+
+    # Один запрос под блокировкой; строки выбираются целиком, чтобы UPDATE ... RETURNING сразу завершился
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    def close(self) -> None:
+        self._db.close()
+
+    # Атомарный резерв ключа; False, если ключ уже занят (резервом или задачей)
+    def reserve(self, key: str) -> bool:
+        now = time.time()
+        _, inserted = self._execute(
+            """INSERT INTO jobs (key, payload, status, available_at, created_at, updated_at)
+               VALUES (?, '{}', 'reserved', ?, ?, ?) ON CONFLICT (key) DO NOTHING""",
+            (key, now, now, now))
+        return inserted == 1
+
+    # Снятие резерва, если задача так и не была поставлена (ошибка LLM, ход отменён)
+    def release(self, key: str) -> None:
+        self._execute("DELETE FROM jobs WHERE key = ? AND status = 'reserved'", (key,))
+
+    # Постановка задачи (в том числе по своему резерву); False, если задача с таким ключом уже есть
+    def enqueue(self, key: str, payload: dict) -> bool:
+        now = time.time()
+        _, inserted = self._execute(
+            """INSERT INTO jobs (key, payload, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (key) DO UPDATE SET payload = excluded.payload, status = 'queued',
+                   available_at = excluded.available_at, updated_at = excluded.updated_at
+               WHERE jobs.status = 'reserved'""",
+            (key, json.dumps(payload, ensure_ascii=False), now, now, now))
+        return inserted == 1
+
+    # Атомарная выдача следующей задачи воркеру (включая задачи с истёкшей арендой);
+    # задачи с истёкшей арендой и исчерпанными попытками сначала помечаются failed
+    def claim(self, worker: str) -> Job:
+        now = time.time()
+        self._execute(
+            """UPDATE jobs SET status = 'failed', lease_until = NULL, error = 'аренда истекла', updated_at = ?
+               WHERE status = 'running' AND lease_until < ? AND attempts >= ?""",
+            (now, now, self.max_attempts))
+        rows, _ = self._execute(
+            """UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, worker = ?, updated_at = ?
+               WHERE id = (SELECT id FROM jobs
+                           WHERE (status = 'queued' AND available_at <= ?)
+                              OR (status = 'running' AND lease_until < ? AND attempts < ?)
+                           ORDER BY id LIMIT 1)
+               RETURNING id, key, payload, attempts""",
+            (now + self.lease, worker, now, now, now, self.max_attempts))
+        if not rows:
+            return None
+        job_id, key, payload, attempts = rows[0]
+        return Job(job_id, key, json.loads(payload), attempts)
+
+    # Продление аренды долгой задачи
+    def touch(self, job: Job) -> None:
+        now = time.time()
+        self._execute("UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                      (now + self.lease, now, job.id))
+
+    # Подтверждение: задача выполнена и больше не выдаётся
+    def ack(self, job: Job, result: dict = None) -> None:
+        self._execute("UPDATE jobs SET status = 'done', lease_until = NULL, result = ?, updated_at = ? WHERE id = ?",
+                      (json.dumps(result) if result is not None else None, time.time(), job.id))
+
+    # Ошибка: повтор с экспоненциальной задержкой; True, если попытки исчерпаны
+    def nack(self, job: Job, error: str) -> bool:
+        now = time.time()
+        if job.attempts >= self.max_attempts:
+            self._execute("UPDATE jobs SET status = 'failed', lease_until = NULL, error = ?, updated_at = ? WHERE id = ?",
+                          (error, now, job.id))
+            return True
+        self._execute(
+            "UPDATE jobs SET status = 'queued', lease_until = NULL, available_at = ?, error = ?, updated_at = ? WHERE id = ?",
+            (now + self.backoff * 2 ** (job.attempts - 1), error, now, job.id))
+        return False
+
+    # Число задач, ожидающих воркера
+    def depth(self) -> int:
+        rows, _ = self._execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'")
+        return rows[0][0]
+
+    # Число задач, которые сейчас рендерятся
+    def running(self) -> int:
+        rows, _ = self._execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'")
+        return rows[0][0]
+
+    # Удаление завершённых задач и брошенных резервов старше max_age секунд
+    # (ключи идемпотентности нужны лишь на время повторов Telegram)
+    def prune(self, max_age: float = 86400) -> int:
+        _, deleted = self._execute("DELETE FROM jobs WHERE status IN ('done', 'failed', 'reserved') AND updated_at < ?",
+                                   (time.time() - max_age,))
+        return deleted
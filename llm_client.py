@@ -0,0 +1,111 @@
+import json
+import time
+import random
+import asyncio
+import logging
+import aiohttp
+
+from metrics import LLM_SECONDS, STAGE_ERRORS, span
+
+# Статусы, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Ошибка запроса к LLM после исчерпания повторов
+class LLMError(Exception):
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+# Долгоживущий клиент OpenRouter: общая сессия с пулом keep-alive соединений,
+# таймауты, повторы с джиттером на 429/5xx; ответ читается потоком (SSE)
+class LLMClient:
+    def __init__(self, api_key: str, base_url: str, model: str, timeout: float = 60, connect_timeout: float = 10,
+                 retries: int = 3, pool_size: int = 20, backoff: float = 0.5):
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.model = model
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.pool_size = pool_size
+        self.backoff = backoff
+        self.session = None
+
+    # Хуки aiohttp-приложения: app.on_startup / app.on_cleanup
+    async def start(self, app=None) -> None:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size,
+                                             keepalive_timeout=60, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            })
+            logging.info(f"Сессия LLM открыта: {self.url}, пул {self.pool_size} соединений")
+
+    async def close(self, app=None) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+            logging.info("Сессия LLM закрыта")
+
+    # Пауза перед повтором: экспонента с полным джиттером, Retry-After имеет приоритет,
+    # но не длиннее общего таймаута запроса; отрицательные и нечисловые значения игнорируются
+    def _delay(self, attempt: int, retry_after: str = None) -> float:
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                delay = None
+            if delay is not None and delay >= 0:
+                return min(delay, self.timeout.total)
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    # Открытие ответа с повторами; возвращает ответ со статусом 200
+    async def _post(self, payload: dict) -> aiohttp.ClientResponse:
+        await self.start()
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = await self.session.post(self.url, json=payload)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                logging.warning(f"Ошибка соединения с LLM (попытка {attempt + 1}): {e!r}")
+                if last_attempt:
+                    raise LLMError(f"Ошибка соединения с LLM: {e!r}")
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            if response.status == 200:
+                return response
+            response_text = await response.text()
+            response.release()
+            if response.status not in RETRY_STATUSES or last_attempt:
+                logging.error(f"Ошибка API: {response.status}, Ответ: {response_text}")
+                raise LLMError(f"Ошибка API: {response.status}: {response_text}", response.status)
+            logging.warning(f"Ошибка API: {response.status} (попытка {attempt + 1}), повтор")
+            await asyncio.sleep(self._delay(attempt, response.headers.get("Retry-After")))
+
+    # Потоковый ответ: фрагменты текста по мере генерации (SSE, stream: true)
+    async def stream(self, messages: list, max_tokens: int = 150):
+        started = time.perf_counter()
+        with span("llm"):
+            try:
+                response = await self._post({"model": self.model, "messages": messages, "max_tokens": max_tokens,
+                                             "stream": True})
+                async with response:
+                    async for raw_line in response.content:
+                        line = raw_line.decode("utf-8").strip()
+                        if not line.startswith("data:"):
+                            continue  # пустые строки и комментарии вида ": OPENROUTER PROCESSING"
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if "error" in chunk:
+                            raise LLMError(f"Ошибка в потоке LLM: {chunk['error']}")
+                        delta = chunk['choices'][0].get('delta', {}).get('content')
+                        if delta:
+                            yield delta
+            except LLMError:
+                STAGE_ERRORS.inc(stage="llm")
+                raise
+        LLM_SECONDS.observe(time.perf_counter() - started)
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+
+
+# Ключ кэша: хэш от очищенного текста и всех параметров, влияющих на результат рендера
+def media_key(text: str, lang: str, tld: str, avatar: str, fps: int, resolution: int, engine: str = "gtts",
+              style: str = "") -> str:
+    params = [text.strip(), lang, tld, avatar, fps, resolution, engine] + ([style] if style else [])
+    payload = json.dumps(params, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Запись кэша: готовые аудио/mp4 на диске и file_id после первой загрузки в Telegram
+class CachedMedia:
+    def __init__(self, key: str, duration: float, size: int, file_id: str = None, audio_ext: str = "mp3"):
+        self.key = key
+        self.duration = duration
+        self.size = size
+        self.file_id = file_id
+        self.audio_ext = audio_ext
+
+
+# Кэш синтезированных ответов на локальном диске с LRU-вытеснением по суммарному размеру;
+# закреплённые записи (готовые фразы прогрева) не вытесняются
+class MediaCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> CachedMedia, от давно использованных к свежим
+        self._pinned = set()
+        self._index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def _load_index(self) -> None:
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            items = []
+        for item in items:
+            if os.path.exists(self._path(item["key"], "mp4")):
+                self._entries[item["key"]] = CachedMedia(item["key"], item["duration"], item["size"],
+                                                         item.get("file_id"), item.get("audio_ext", "mp3"))
+        logging.info(f"Кэш медиа: {len(self._entries)} записей, {self.total_bytes / (1024 * 1024):.1f} МБ")
+
+    def _save_index(self) -> None:
+        items = [vars(entry) for entry in self._entries.values()]
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _remove_files(self, entry: CachedMedia) -> None:
+        for ext in (entry.audio_ext, "mp4"):
+            try:
+                os.remove(self._path(entry.key, ext))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            entry = self._entries.pop(key)
+            self._remove_files(entry)
+            logging.info(f"Кэш медиа: вытеснена запись {key[:12]}")
+
+    def get(self, key: str) -> CachedMedia:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    # Запись без учёта в статистике и без обновления порядка LRU
+    def peek(self, key: str) -> CachedMedia:
+        return self._entries.get(key)
+
+    # Закрепление записи: она не вытесняется, пока процесс жив
+    def pin(self, key: str) -> None:
+        if key in self._entries:
+            self._pinned.add(key)
+
+    # Видео из кэша (нужно, если file_id ещё неизвестен или устарел)
+    def read_video(self, key: str) -> bytes:
+        with open(self._path(key, "mp4"), "rb") as f:
+            return f.read()
+
+    def put(self, key: str, audio_data: bytes, video_data: bytes, duration: float, audio_ext: str = "mp3") -> CachedMedia:
+        for ext, data in ((audio_ext, audio_data), ("mp4", video_data)):
+            tmp_path = f"{self._path(key, ext)}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key, ext))
+        entry = CachedMedia(key, duration, len(audio_data) + len(video_data), audio_ext=audio_ext)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._evict()
+        self._save_index()
+        return entry
+
+    def set_file_id(self, key: str, file_id: str) -> None:
+        entry = self._entries.get(key)
+        if entry is not None and entry.file_id != file_id:
+            entry.file_id = file_id
+            self._save_index()
+
+    # Сброс file_id, если Telegram его больше не принимает
+    def drop_file_id(self, key: str) -> None:
+        self.set_file_id(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,244 @@
+import os
+import io
+import time
+import uuid
+import random
+import bisect
+import pstats
+import logging
+import cProfile
+import functools
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import TRACE_SPANS, PROFILE_SAMPLE_RATE, PROFILE_DIR
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(kb * 1024 for kb in (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+
+_lock = threading.Lock()
+_registry = {}  # имя -> метрика, в порядке объявления
+_buffer = None  # в процессе-воркере пула: наблюдения копятся и возвращаются вместе с результатом
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: tuple = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Метрика в текстовом формате Prometheus; значения хранятся по кортежу значений меток
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        _registry[name] = self
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    # В процессе-воркере наблюдение откладывается до возврата в основной процесс
+    def _defer(self, op: str, value: float, labels: dict) -> bool:
+        if _buffer is None:
+            return False
+        _buffer.append((self.name, op, value, labels))
+        return True
+
+    @abstractmethod
+    def lines(self) -> list:
+        ...
+
+    def render(self) -> str:
+        header = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(header + self.lines())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if self._defer("inc", amount, labels):
+            return
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def lines(self) -> list:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+# Текущее значение; можно задать функцию, которая вызывается при каждом опросе /metrics
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._function = None
+
+    def set(self, value: float, **labels) -> None:
+        if self._defer("set", value, labels):
+            return
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function) -> None:
+        self._function = function
+
+    def lines(self) -> list:
+        if self._function is not None:
+            try:
+                self._values[()] = self._function()
+            except Exception as e:
+                logging.warning(f"Метрика {self.name} не считана: {str(e)}")
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        if self._defer("observe", value, labels):
+            return
+        key = self._key(labels)
+        with _lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def lines(self) -> list:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{"+Inf" if bound == float("inf") else _format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+# --- Метрики горячего пути ---
+
+LLM_SECONDS = Histogram("bot_llm_seconds", "Время полного ответа LLM, сек")
+TTS_SECONDS = Histogram("bot_tts_seconds", "Синтез речи одним вызовом движка TTS, сек", ["engine"])
+FRAME_SECONDS = Histogram("bot_frame_seconds", "Подготовка кадров аватара, сек")
+ENCODE_SECONDS = Histogram("bot_encode_seconds", "Сборка и кодирование видеокружка, сек", ["mode"])
+UPLOAD_SECONDS = Histogram("bot_upload_seconds", "Отправка видеокружка в Telegram, сек", ["source"])
+VIDEO_BYTES = Histogram("bot_video_bytes", "Размер видеокружка, байт", buckets=SIZE_BUCKETS)
+STAGE_ERRORS = Counter("bot_stage_errors_total", "Ошибки по этапам ответа", ["stage"])
+RENDERS_IN_FLIGHT = Gauge("bot_renders_in_flight", "Задачи рендера в работе и в очереди")
+RENDER_QUEUE_DEPTH = Gauge("bot_render_queue_depth", "Задачи рендера, ожидающие воркера")
+USER_TURNS = Counter("bot_user_turns_total", "Сообщения пользователей по исходу: handled, coalesced, superseded, limited",
+                     ["outcome"])
+
+
+# Текст для эндпоинта /metrics
+def render_metrics() -> str:
+    with _lock:
+        return "\n".join(metric.render() for metric in _registry.values()) + "\n"
+
+
+async def metrics_handler(request):
+    from aiohttp import web
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+# --- Воркеры пула: наблюдения из дочернего процесса передаются в основной ---
+
+# Выполняется в процессе-воркере: результат возвращается вместе с накопленными наблюдениями;
+# при ошибке наблюдения прикрепляются к исключению (атрибуты исключения переживают pickle)
+def call_with_samples(fn, *args):
+    global _buffer
+    _buffer = samples = []
+    try:
+        return fn(*args), samples
+    except Exception as e:
+        e.metric_samples = samples
+        raise
+    finally:
+        _buffer = None
+
+
+# Применение наблюдений воркера к метрикам основного процесса
+def replay(samples) -> None:
+    for name, op, value, labels in samples or ():
+        metric = _registry.get(name)
+        if metric is not None:
+            getattr(metric, op)(value, **labels)
+
+
+# --- Трассировка: спаны одного запроса с общим trace id (TRACE_SPANS=1) ---
+
+trace_id = ContextVar("trace_id", default=None)
+
+
+def new_trace() -> str:
+    value = uuid.uuid4().hex[:12]
+    trace_id.set(value)
+    return value
+
+
+@contextmanager
+def span(name: str, **attrs):
+    if not TRACE_SPANS:
+        yield
+        return
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        details = "".join(f" {key}={value}" for key, value in attrs.items())
+        logging.info(f"trace={trace_id.get() or '-'} span={name} {time.perf_counter() - started:.3f}с "
+                     f"status={status}{details}")
+
+
+# --- Выборочное профилирование рендера (PROFILE_SAMPLE_RATE — доля профилируемых вызовов) ---
+
+def maybe_profile(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            _dump_profile(profiler, fn.__name__)
+    return wrapper
+
+
+def _dump_profile(profiler: cProfile.Profile, name: str) -> None:
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+        logging.info(f"Профиль {name} сохранён: {path}\n{summary.getvalue()}")
+    except Exception as e:
+        logging.warning(f"Не удалось сохранить профиль {name}: {str(e)}")
@@ -0,0 +1,62 @@
+# Локальная заглушка OpenRouter для тестов и бенчмарков.
+# Запуск: python mock_openrouter.py --port 8081 [--latency 0.2] [--fail 2 --fail-status 429]
+# и OPENROUTER_BASE_URL=http://127.0.0.1:8081/api/v1 для бота.
+import json
+import asyncio
+import argparse
+import logging
+from aiohttp import web
+
+DEFAULT_REPLY = "Привет! Рада тебя слышать. Как прошёл твой день? Расскажи, что нового."
+
+
+# Приложение-заглушка: отвечает фиксированным текстом, умеет SSE, задержку и отказы
+def create_mock_app(reply: str = DEFAULT_REPLY, latency: float = 0.0, token_delay: float = 0.0,
+                    fail: int = 0, fail_status: int = 500) -> web.Application:
+    app = web.Application()
+    app["requests"] = 0
+    app["failures_left"] = fail
+    app["reply"] = reply  # можно менять между запросами (бенчмарк разной длины ответов)
+    app["prompts"] = []  # последнее сообщение пользователя из каждого запроса
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        request.app["requests"] += 1
+        payload = await request.json()
+        request.app["prompts"].append((payload.get("messages") or [{}])[-1].get("content", ""))
+        if request.app["failures_left"] > 0:
+            request.app["failures_left"] -= 1
+            return web.json_response({"error": {"message": "mock failure"}}, status=fail_status,
+                                     headers={"Retry-After": "0"} if fail_status == 429 else None)
+        await asyncio.sleep(latency)
+        if not payload.get("stream"):
+            return web.json_response({
+                "id": "mock", "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": request.app["reply"]}, "finish_reason": "stop"}],
+            })
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": OPENROUTER PROCESSING\n\n")
+        for word in request.app["reply"].split(" "):
+            chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(token_delay)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app.router.add_post("/api/v1/chat/completions", chat_completions)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка OpenRouter")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка перед ответом, сек")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="пауза между словами в SSE, сек")
+    parser.add_argument("--fail", type=int, default=0, help="сколько первых запросов завершить ошибкой")
+    parser.add_argument("--fail-status", type=int, default=500)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    web.run_app(create_mock_app(args.reply, args.latency, args.token_delay, args.fail, args.fail_status),
+                host="127.0.0.1", port=args.port)
@@ -0,0 +1,140 @@
+import re
+import time
+import asyncio
+import logging
+from contextlib import aclosing
+
+from render import remove_emojis, split_text_for_display, load_font, render_speech, reply_cache_key
+from metrics import span
+from render_pool import RenderRejected
+from tts import synthesize_batch
+
+# Граница предложения: завершающий знак препинания и пробел после него
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+MAX_SENTENCE_WIDTH = 1200  # в пикселях шрифта по умолчанию; длинные предложения режутся по словам
+
+
+# Есть ли в тексте что произносить (gTTS падает на строках из одних знаков)
+def speakable(text: str) -> bool:
+    return any(ch.isalnum() for ch in text)
+
+
+# Разбиение текста на предложения; слишком длинные режутся по ширине, как субтитры
+def split_sentences(text: str, max_width: int = MAX_SENTENCE_WIDTH) -> list:
+    font = load_font()
+    sentences = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        if font.getlength(sentence) > max_width:
+            sentences.extend(split_text_for_display(sentence, max_width, font))
+        elif sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+# Потоковая нарезка ответа LLM: возвращает предложения, как только они завершены
+class SentenceSplitter:
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, delta: str) -> list:
+        self.buffer += delta
+        boundaries = list(SENTENCE_END.finditer(self.buffer))
+        if not boundaries:
+            return []
+        complete, self.buffer = self.buffer[:boundaries[-1].start()], self.buffer[boundaries[-1].end():]
+        return split_sentences(complete)
+
+    def flush(self) -> list:
+        rest, self.buffer = self.buffer, ""
+        return split_sentences(rest)
+
+
+# Результат конвейера: текст ответа, запись кэша медиа и свежесобранное видео (если рендерилось)
+class ReplyResult:
+    def __init__(self, ai_text: str, clean_text: str, entry=None, video_data: bytes = None,
+                 timings: dict = None, rejected: str = None):
+        self.ai_text = ai_text
+        self.clean_text = clean_text
+        self.entry = entry
+        self.video_data = video_data
+        self.timings = timings or {}
+        self.rejected = rejected
+
+
+def log_timings(timings: dict) -> None:
+    logging.info("Задержки по этапам: " + ", ".join(f"{name}={value:.2f}с" for name, value in timings.items()))
+
+
+# Конвейер ответа: TTS первого предложения стартует, пока LLM ещё дописывает остальные;
+# предложения, пришедшие одним фрагментом, синтезируются одним вызовом движка.
+# По готовности всех фрагментов аудио склеивается и один раз собирается видеокружок
+class ReplyPipeline:
+    def __init__(self, executor, cache, tts_concurrency: int = 3):
+        self.executor = executor
+        self.cache = cache
+        self.tts_concurrency = tts_concurrency
+
+    async def _synthesize(self, index: int, sentences: list, limit: asyncio.Semaphore, started: float, timings: dict):
+        async with limit:
+            with span("tts", batch=index + 1, sentences=len(sentences)):
+                speeches = await self.executor.run(synthesize_batch, sentences)
+        elapsed = time.perf_counter() - started
+        timings.setdefault("tts_first", elapsed)
+        duration = sum(speech.duration for speech in speeches)
+        logging.info(f"TTS фрагмента {index + 1} ({len(sentences)} предл.) готов через {elapsed:.2f}с: {duration:.2f}с аудио")
+        return speeches
+
+    async def run(self, user_id: int, deltas) -> ReplyResult:
+        async with self.executor.user_slot(user_id):
+            started = time.perf_counter()
+            timings = {}
+            limit = asyncio.Semaphore(self.tts_concurrency)
+            splitter = SentenceSplitter()
+            parts = []
+            tasks = []
+
+            def schedule(sentences: list) -> None:
+                sentences = [remove_emojis(sentence).strip() for sentence in sentences]
+                sentences = [sentence for sentence in sentences if speakable(sentence)]
+                if sentences:
+                    tasks.append(asyncio.create_task(self._synthesize(len(tasks), sentences, limit, started, timings)))
+
+            try:
+                async with aclosing(deltas) as stream:
+                    async for delta in stream:
+                        timings.setdefault("llm_first_token", time.perf_counter() - started)
+                        parts.append(delta)
+                        schedule(splitter.feed(delta))
+                timings["llm"] = time.perf_counter() - started
+
+                ai_text = "".join(parts).strip()
+                clean_text = remove_emojis(ai_text)
+                logging.info(f"Ответ от OpenRouter: {ai_text}")
+
+                # Повторяющийся ответ: берём из кэша до синтеза хвоста ответа (а короткий ответ
+                # одним предложением не синтезируется вовсе); начатый синтез больше не нужен
+                cache_key = reply_cache_key(clean_text)
+                entry = self.cache.get(cache_key)
+                if entry is not None:
+                    logging.info(f"Ответ найден в кэше медиа: {cache_key[:12]}")
+                    return ReplyResult(ai_text, clean_text, entry, timings=timings)
+                schedule(splitter.flush())
+                if not tasks:
+                    return ReplyResult(ai_text, clean_text, timings=timings)
+
+                try:
+                    batches = await asyncio.gather(*tasks)
+                    timings["tts"] = time.perf_counter() - started
+                    render_started = time.perf_counter()
+                    with span("render"):
+                        video_data, speech = await self.executor.run(
+                            render_speech, clean_text, [speech for batch in batches for speech in batch])
+                    timings["render"] = time.perf_counter() - render_started
+                except RenderRejected as e:
+                    return ReplyResult(ai_text, clean_text, timings=timings, rejected=str(e))
+                entry = self.cache.put(cache_key, speech.data, video_data, speech.duration, audio_ext=speech.format)
+                timings["total"] = time.perf_counter() - started
+                return ReplyResult(ai_text, clean_text, entry, video_data, timings)
+            finally:
+                for task in tasks:
+                    task.cancel()
@@ -0,0 +1,219 @@
+import re
+import time
+import logging
+
+from config import VIDEO_RENDERER, RENDER_MODE, AVATAR_PATH, TTS_ENGINES, TTS_LANG, TTS_TLD
+from config import ENCODE_PROFILE, SUBTITLES, SUBTITLE_FONT_SIZE, LIPSYNC, MOUTH_SPRITES, MOUTH_POSITION
+from encoder import EncodeProfile, encode_video_note, get_profile
+from media_cache import media_key
+from metrics import FRAME_SECONDS, ENCODE_SECONDS, VIDEO_BYTES, STAGE_ERRORS, maybe_profile
+from tts import Speech, synthesize, join_speech
+
+# Тяжёлые зависимости рендера (PIL, NumPy, кадры аватара, композитор, moviepy) импортируются
+# внутри функций: webhook-процессу из этого модуля нужны только remove_emojis и reply_cache_key
+
+# Параметры видео (вместе с настройками TTS входят в ключ кэша готовых ответов)
+VIDEO_FPS = 15  # 15 FPS для замедления
+VIDEO_SIZE = 480
+
+# Кэширование шрифта
+FONT = None
+def load_font(size=16):
+    global FONT
+    from PIL import ImageFont
+    if FONT is None or FONT.size != size:
+        try:
+            FONT = ImageFont.truetype("fonts/arial.ttf", size)
+            logging.info(f"Шрифт arial.ttf успешно загружен, размер {size}")
+        except:
+            FONT = ImageFont.load_default()
+            logging.warning("Шрифт arial.ttf не найден, используется дефолтный")
+    return FONT
+
+
+# Удаление смайликов из текста
+def remove_emojis(text: str) -> str:
+    emoji_pattern = re.compile(
+        "["
+        u"\U0001F600-\U0001F64F"  # Эмодзи (улыбки, лица)
+        u"\U0001F300-\U0001F5FF"  # Символы и пиктограммы
+        u"\U0001F680-\U0001F6FF"  # Транспорт и карты
+        u"\U0001F700-\U0001F77F"  # Алхимические символы
+        u"\U0001F780-\U0001F7FF"  # Геометрические фигуры
+        u"\U0001F800-\U0001F8FF"  # Стрелки
+        u"\U0001F900-\U0001F9FF"  # Дополнительные эмодзи
+        u"\U0001FA00-\U0001FA6F"  # Шахматы и др.
+        u"\U0001FA70-\U0001FAFF"  # Новые эмодзи
+        u"\U00002700-\U000027BF"  # Декоративные символы
+        u"\U00002600-\U000026FF"  # Разные символы
+        "]+", flags=re.UNICODE)
+    return emoji_pattern.sub(r'', text)
+
+
+# Синтез речи выбранным движком TTS (gTTS, Piper, с откатом на следующий при сбое)
+def text_to_speech(text: str) -> Speech:
+    try:
+        text = text.strip().encode('utf-8').decode('utf-8', errors='ignore')  # Очистка кодировки
+        return synthesize(text)
+    except Exception as e:
+        logging.error(f"Ошибка генерации аудио: {str(e)}")
+        raise
+
+# Разбиение текста на части для отображения
+def split_text_for_display(text: str, max_width: int, font) -> list:
+    words = text.split()
+    lines = []
+    current_line = []
+    current_width = 0
+    for word in words:
+        word_width = font.getlength(word + " ")
+        if current_width + word_width <= max_width:
+            current_line.append(word)
+            current_width += word_width
+        else:
+            lines.append(" ".join(current_line))
+            current_line = [word]
+            current_width = word_width
+    if current_line:
+        lines.append(" ".join(current_line))
+    return lines
+
+# Субтитры и анимация рта меняют кадры, поэтому готовый цикл аватара для них не подходит
+def compositing_enabled() -> bool:
+    return SUBTITLES or LIPSYNC
+
+
+def uses_segments() -> bool:
+    return VIDEO_RENDERER == "animation" and RENDER_MODE == "segments" and not compositing_enabled()
+
+
+# Профиль кодирования: из ENCODE_PROFILE или лучший по замерам для текущего режима рендера
+def encode_profile() -> EncodeProfile:
+    return get_profile(ENCODE_PROFILE or ("small" if uses_segments() else "balanced"))
+
+
+# Кадры с субтитрами и анимацией рта: всё тяжёлое (растеризация строк, огибающая громкости)
+# считается один раз на ответ, кадры собираются пачками по мере чтения ffmpeg
+def composite_frames(text: str, speech: Speech, num_frames: int, subtitles: bool = SUBTITLES, buffer=None):
+    from compositor import Compositor, caption_schedule, rms_envelope, load_mouth_sprites
+    captions = []
+    if subtitles:
+        font = load_font(SUBTITLE_FONT_SIZE)
+        lines = split_text_for_display(text, int(VIDEO_SIZE * 0.75), font)
+        captions = caption_schedule(lines, font, num_frames, (VIDEO_SIZE, VIDEO_SIZE))
+    envelope = sprites = None
+    if LIPSYNC:
+        pcm = speech.to_pcm()
+        envelope = rms_envelope(pcm.data, pcm.sample_rate, num_frames, VIDEO_FPS)
+        sprites = load_mouth_sprites(MOUTH_SPRITES, MOUTH_POSITION) if MOUTH_SPRITES else None
+    return Compositor(num_frames, captions, envelope, sprites).chunks(buffer=buffer)
+
+
+# Генерация анимации с пользовательской GIF (замедленная)
+def create_animation(text: str, speech: Speech) -> bytes:
+    from avatar_cache import avatar_sequence
+    from avatar_segments import assemble_from_segments
+    # Быстрый путь: готовый цикл аватара + копирование потока, кодируется только аудио
+    if uses_segments():
+        try:
+            started = time.perf_counter()
+            video_data = assemble_from_segments(speech, profile=encode_profile())
+            ENCODE_SECONDS.observe(time.perf_counter() - started, mode="segments")
+            VIDEO_BYTES.observe(len(video_data))
+            return video_data
+        except Exception as e:
+            STAGE_ERRORS.inc(stage="segments")
+            logging.error(f"Ошибка сборки из сегментов, кодируем покадрово: {str(e)}")
+
+    num_frames = int(speech.duration * VIDEO_FPS)
+
+    # Кадры аватара из кэша (декодируются один раз на процесс), с субтитрами и ртом — через композитор
+    started = time.perf_counter()
+    if compositing_enabled():
+        frames = composite_frames(text, speech, num_frames)
+    else:
+        frames = avatar_sequence(num_frames)
+    FRAME_SECONDS.observe(time.perf_counter() - started)
+
+    # Кадры и аудио передаются в ffmpeg через pipe/memfd, результат читается из stdout
+    started = time.perf_counter()
+    try:
+        video_data = encode_video_note(frames, speech, fps=VIDEO_FPS, profile=encode_profile())
+    except Exception:
+        STAGE_ERRORS.inc(stage="encode")
+        raise
+    ENCODE_SECONDS.observe(time.perf_counter() - started, mode="frames")
+    VIDEO_BYTES.observe(len(video_data))
+
+    # Проверка размера файла
+    video_size = len(video_data) / (1024 * 1024)  # Размер в МБ
+    logging.info(f"Видео создано, размер: {video_size:.2f} МБ")
+    return video_data
+
+
+_generator = None
+
+
+# Видеокружок выбранным рендерером (VIDEO_RENDERER); генератор создаётся один раз на процесс
+def animate(text: str, speech: Speech) -> bytes:
+    global _generator
+    if VIDEO_RENDERER == "improved":
+        if _generator is None:
+            from improved_video_gen import ImprovedVideoGenerator  # модуль сам импортирует render
+            _generator = ImprovedVideoGenerator(profile=encode_profile())
+        return _generator.render(text, speech)
+    return create_animation(text, speech)
+
+
+# Подготовка процесса-воркера: кадры аватара, закодированный цикл, шрифт субтитров и спрайты рта
+def preload_render() -> None:
+    from avatar_cache import preload_avatars
+    from avatar_segments import avatar_loop
+    from compositor import load_mouth_sprites
+    preload_avatars()
+    if uses_segments():
+        try:
+            avatar_loop(profile=encode_profile())
+        except Exception as e:
+            logging.error(f"Не удалось подготовить цикл аватара: {str(e)}")
+    if SUBTITLES or VIDEO_RENDERER == "improved":
+        load_font(SUBTITLE_FONT_SIZE)
+    if LIPSYNC and MOUTH_SPRITES:
+        load_mouth_sprites(MOUTH_SPRITES, MOUTH_POSITION)
+
+
+# Прогрев процесса рендера: подготовка как в preload_render плюс одно кодирование
+# полсекунды тишины — первый настоящий ответ не платит за запуск ffmpeg и холодный кэш диска
+def warm_render() -> float:
+    started = time.perf_counter()
+    preload_render()
+    animate("", Speech(bytes(24000), 24000))
+    return time.perf_counter() - started
+
+
+# Ключ кэша готового ответа для очищенного текста
+def reply_cache_key(text: str) -> str:
+    parts = []
+    if VIDEO_RENDERER != "animation":
+        parts.append(VIDEO_RENDERER)
+    parts.append(f"enc:{encode_profile().name}")
+    if SUBTITLES:
+        parts.append(f"sub{SUBTITLE_FONT_SIZE}")
+    if LIPSYNC:
+        parts.append(f"lip:{MOUTH_SPRITES}")
+    return media_key(text, TTS_LANG, TTS_TLD, AVATAR_PATH, VIDEO_FPS, VIDEO_SIZE, TTS_ENGINES, ":".join(parts))
+
+
+# Полный рендер ответа: аудио + видеокружок (выполняется в процессе-воркере)
+@maybe_profile
+def render_reply(text: str) -> tuple[bytes, Speech]:
+    speech = text_to_speech(text)
+    video_data = animate(text, speech)
+    return video_data, speech
+
+
+# Склейка фрагментов речи и сборка видеокружка (выполняется в процессе-воркере)
+@maybe_profile
+def render_speech(text: str, parts: list) -> tuple[bytes, Speech]:
+    speech = join_speech(parts)
+    return animate(text, speech), speech
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import STAGE_ERRORS, call_with_samples, replay
+
+
+# Рендер отклонён: очередь переполнена или у пользователя уже идут рендеры
+class RenderRejected(Exception):
+    pass
+
+
+# Пул процессов для тяжёлого рендера (TTS + кодирование видео).
+# Event loop только ждёт futures, а очередь ограничена: при переполнении
+# задача ждёт слот не дольше wait_timeout, после чего отклоняется.
+class RenderExecutor:
+    def __init__(self, workers: int, queue_size: int, per_user: int, wait_timeout: float, initializer=None):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.per_user = max(1, per_user)
+        self.wait_timeout = wait_timeout
+        self.initializer = initializer
+        self._executor = None
+        self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+        self._user_jobs = defaultdict(int)
+        self.in_flight = 0
+
+    # Количество задач, ожидающих свободного воркера
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+            logging.info(f"Пул рендера запущен: {self.workers} воркеров, очередь {self.queue_size}")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logging.info("Пул рендера остановлен")
+
+    # Резерв места пользователя на всё время подготовки ответа
+    @asynccontextmanager
+    async def user_slot(self, user_id: int):
+        if self._user_jobs[user_id] >= self.per_user:
+            raise RenderRejected("предыдущий ответ ещё готовится")
+        self._user_jobs[user_id] += 1
+        try:
+            yield
+        finally:
+            self._user_jobs[user_id] -= 1
+            if self._user_jobs[user_id] <= 0:
+                del self._user_jobs[user_id]
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+
+    # Выполнение задачи в пуле с ограничением общей очереди.
+    # Слот освобождается по завершении самой задачи в пуле, а не ожидания: отмена ожидания
+    # (ответ устарел) снимает ещё не начатую задачу, но начатая держит слот до конца
+    async def run(self, fn, *args):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Очередь рендера переполнена: {self.in_flight} задач")
+            STAGE_ERRORS.inc(stage="queue")
+            raise RenderRejected("сервер перегружен, попробуй чуть позже")
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        try:
+            self.start()
+            future = self._executor.submit(call_with_samples, fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release_from(loop))
+        logging.info(f"Рендер поставлен в очередь: {fn.__name__}, глубина очереди {self.queue_depth}")
+        # Метрики, записанные в процессе-воркере, переносятся в основной процесс
+        try:
+            result, samples = await asyncio.wrap_future(future)
+        except Exception as e:
+            replay(getattr(e, "metric_samples", None))
+            raise
+        replay(samples)
+        return result
+
+    # Колбэк future пула приходит из служебного потока executor
+    def _release_from(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass  # event loop уже закрыт
+
+    async def submit(self, user_id: int, fn, *args):
+        async with self.user_slot(user_id):
+            return await self.run(fn, *args)
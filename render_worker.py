@@ -0,0 +1,162 @@
+import os
+import time
+import socket
+import asyncio
+import functools
+import logging
+import multiprocessing
+import multiprocessing.connection
+from aiogram import Bot
+
+from config import MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB
+from config import TELEGRAM_TOKEN, STORAGE_PATH, JOB_QUEUE_PATH, JOB_LEASE, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL
+from config import RENDER_WORKER_PROCESSES, JOB_RETENTION, JOB_PRUNE_INTERVAL
+from config import WARMUP, WARMUP_PHRASES
+from delivery import send_video_note
+from job_queue import JobQueue
+from media_cache import MediaCache
+from render import warm_render, remove_emojis, render_reply, reply_cache_key
+from storage import Storage
+
+WORKER_RESTART_DELAY = 1.0  # сек между падением процесса-воркера и его перезапуском
+
+
+# Продление аренды, пока задача рендерится (на случай ответов длиннее JOB_LEASE)
+async def keep_lease(queue: JobQueue, job) -> None:
+    while True:
+        await asyncio.sleep(queue.lease / 3)
+        await asyncio.to_thread(queue.touch, job)
+
+
+# Одна задача: TTS + видеокружок (или готовый ответ из кэша воркера), отправка в чат, подтверждение.
+# Доставка видео — не менее одного раза: ack пишется сразу после успешной отправки, а ошибки
+# до отправки приводят к повтору задачи; если воркер упадёт между отправкой и ack, аренда истечёт
+# и повтор отправит видеокружок ещё раз. Текст ответа и списание идут после ack: они не
+# повторяются, но при падении сразу после ack теряются. Задача canned — готовая фраза
+# (приветствие, ответ при ошибке): без текста ответа и списания кредита.
+async def process_job(bot: Bot, queue: JobQueue, storage: Storage, cache: MediaCache, job) -> None:
+    payload = job.payload
+    chat_id, reply_to = payload["chat_id"], payload["reply_to"]
+    key = reply_cache_key(payload["clean_text"])
+    video_data = None
+    lease = asyncio.create_task(keep_lease(queue, job))
+    try:
+        entry = cache.get(key)
+        if entry is None:
+            video_data, speech = await asyncio.to_thread(render_reply, payload["clean_text"])
+            entry = cache.put(key, speech.data, video_data, speech.duration, audio_ext=speech.format)
+        send = functools.partial(bot.send_video_note, chat_id, reply_to_message_id=reply_to)
+        sent = await send_video_note(send, cache, entry, video_data)
+    except Exception as e:
+        logging.error(f"Задача {job.key} (попытка {job.attempts}): {str(e)}")
+        if await asyncio.to_thread(queue.nack, job, str(e)) and not payload.get("canned"):
+            await bot.send_message(chat_id, f"{payload['ai_text']}\n\n(Видео не будет: {str(e)})",
+                                   reply_to_message_id=reply_to)
+        return
+    finally:
+        lease.cancel()
+
+    await asyncio.to_thread(queue.ack, job, {"message_id": sent.message_id})
+    rendered = f"{len(video_data) / (1024 * 1024):.2f} МБ" if video_data is not None else "из кэша"
+    logging.info(f"Задача {job.key} выполнена: {rendered}, {entry.duration:.2f} сек")
+    if payload.get("canned"):
+        return
+    await storage.debit(payload["user_id"])
+    await bot.send_message(chat_id, payload["ai_text"], reply_to_message_id=reply_to)
+
+
+# Готовые видеокружки частых фраз, закреплённые в кэше воркера (прогрев в режиме очереди); уже готовые не рендерятся
+async def prerender_phrases(cache: MediaCache, phrases: list) -> int:
+    ready = 0
+    for phrase in phrases:
+        clean_text = remove_emojis(phrase).strip()
+        if not clean_text:
+            continue
+        key = reply_cache_key(clean_text)
+        try:
+            if cache.peek(key) is None:
+                video_data, speech = await asyncio.to_thread(render_reply, clean_text)
+                cache.put(key, speech.data, video_data, speech.duration, audio_ext=speech.format)
+            cache.pin(key)
+            ready += 1
+        except Exception as e:
+            logging.error(f"Фраза для прогрева не подготовлена ({phrase!r}): {str(e)}")
+    return ready
+
+
+# Удаление старых завершённых задач; выполняет только первый воркер, при старте и раз в JOB_PRUNE_INTERVAL
+async def prune_jobs(queue: JobQueue) -> None:
+    pruned = await asyncio.to_thread(queue.prune, JOB_RETENTION)
+    if pruned:
+        logging.info(f"Из очереди удалено старых задач: {pruned}")
+
+
+async def worker_loop(index: int) -> None:
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    queue = JobQueue(JOB_QUEUE_PATH, lease=JOB_LEASE, max_attempts=JOB_MAX_ATTEMPTS)
+    storage = Storage(STORAGE_PATH)
+    bot = Bot(token=TELEGRAM_TOKEN)
+    # Свой каталог кэша на процесс: индекс MediaCache живёт в памяти и не делится между процессами
+    cache = MediaCache(os.path.join(MEDIA_CACHE_DIR, f"worker{index}"),
+                       MEDIA_CACHE_MAX_MB * 1024 * 1024 // RENDER_WORKER_PROCESSES)
+    await storage.start()
+    warmed = await asyncio.to_thread(warm_render)
+    phrases = await prerender_phrases(cache, WARMUP_PHRASES) if WARMUP else 0
+    logging.info(f"Воркер рендера {worker_id} готов (прогрев {warmed:.2f} сек, готово фраз {phrases})")
+    next_prune = 0.0
+    try:
+        while True:
+            if index == 0 and time.monotonic() >= next_prune:
+                await prune_jobs(queue)
+                next_prune = time.monotonic() + JOB_PRUNE_INTERVAL
+            job = await asyncio.to_thread(queue.claim, worker_id)
+            if job is None:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            try:
+                await process_job(bot, queue, storage, cache, job)
+            except Exception as e:
+                logging.error(f"Ошибка воркера на задаче {job.key}: {str(e)}")
+    finally:
+        await storage.close()
+        await bot.session.close()
+        queue.close()
+
+
+def run_worker(index: int) -> None:
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s - %(levelname)s - [worker {index}] %(message)s")
+    try:
+        asyncio.run(worker_loop(index))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_worker(index: int) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=run_worker, args=(index,), daemon=True)
+    process.start()
+    return process
+
+
+# Надзор за процессами-воркерами: завершившийся процесс (падение, OOM) запускается заново
+# с тем же индексом; пауза перед перезапуском не даёт крутиться в цикле падений при старте
+def supervise_workers(count: int, restart_delay: float = WORKER_RESTART_DELAY) -> None:
+    processes = {index: start_worker(index) for index in range(count)}
+    try:
+        while True:
+            multiprocessing.connection.wait([process.sentinel for process in processes.values()])
+            for index, process in processes.items():
+                if not process.is_alive():
+                    logging.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапуск")
+                    time.sleep(restart_delay)
+                    processes[index] = start_worker(index)
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+
+
+# Запуск: python render_worker.py — по одному процессу на ядро (RENDER_WORKER_PROCESSES)
+if __name__ == '__main__':
+    if not TELEGRAM_TOKEN:
+        raise ValueError("TELEGRAM_TOKEN not set")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    supervise_workers(RENDER_WORKER_PROCESSES)
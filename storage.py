@@ -0,0 +1,192 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    credits INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL
+);
+"""
+
+
+# Грубая оценка числа токенов (для кириллицы ~3 символа на токен)
+def estimate_tokens(text: str) -> int:
+    return len(text) // 3 + 1
+
+
+# Сжатая запись старой реплики для краткого содержания разговора
+def digest_turn(role: str, content: str, limit: int = 120) -> str:
+    content = " ".join(content.split())
+    if len(content) > limit:
+        content = content[:limit].rstrip() + "…"
+    return f"{'Пользователь' if role == 'user' else 'Ты'}: {content}"
+
+
+# Хранилище балансов и истории диалогов в SQLite (WAL).
+# Все запросы идут через один поток, поэтому event loop не блокируется;
+# списания атомарны (один UPDATE с условием), реплики пишутся пачками раз в flush_interval,
+# а в контекст попадает окно последних реплик в пределах history_tokens плюс
+# краткое содержание более старых.
+class Storage:
+    def __init__(self, path: str, history_tokens: int = 1500, summary_tokens: int = 300, flush_interval: float = 1.0):
+        self.path = path
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.flush_interval = flush_interval
+        self._db = None
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self._pending = defaultdict(list)  # user_id -> [(role, content, tokens, created_at)]
+        self._flush_task = None
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._thread, fn, *args)
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    # Хуки aiohttp-приложения: app.on_startup / app.on_cleanup
+    async def start(self, app=None) -> None:
+        if self._db is None:
+            await self._call(self._open)
+            self._flush_task = asyncio.create_task(self._flush_loop())
+            logging.info(f"Хранилище открыто: {self.path}")
+
+    async def close(self, app=None) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._db is not None:
+            await self.flush()
+            await self._call(self._db.close)
+            self._db = None
+            logging.info("Хранилище закрыто")
+
+    # --- Баланс ---
+
+    def _ensure_user(self, user_id: int, start_credits: int) -> int:
+        self._db.execute("INSERT OR IGNORE INTO users (user_id, credits, created_at) VALUES (?, ?, ?)",
+                         (user_id, start_credits, time.time()))
+        return self._db.execute("SELECT credits FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    # Регистрация пользователя со стартовыми кредитами (только при первом обращении)
+    async def ensure_user(self, user_id: int, start_credits: int) -> int:
+        return await self._call(self._ensure_user, user_id, start_credits)
+
+    def _get_balance(self, user_id: int) -> int:
+        row = self._db.execute("SELECT credits FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    async def get_balance(self, user_id: int) -> int:
+        return await self._call(self._get_balance, user_id)
+
+    def _debit(self, user_id: int, amount: int) -> bool:
+        cursor = self._db.execute("UPDATE users SET credits = credits - ? WHERE user_id = ? AND credits >= ?",
+                                  (amount, user_id, amount))
+        return cursor.rowcount == 1
+
+    # Атомарное списание: False, если кредитов не хватает
+    async def debit(self, user_id: int, amount: int = 1) -> bool:
+        return await self._call(self._debit, user_id, amount)
+
+    # --- История ---
+
+    # Реплика попадает в буфер и записывается в базу вместе с другими при следующем сбросе
+    def add_turn(self, user_id: int, role: str, content: str) -> None:
+        self._pending[user_id].append((role, content, estimate_tokens(content), time.time()))
+
+    def _get_context(self, user_id: int, pending: list) -> list:
+        row = self._db.execute("SELECT summary FROM summaries WHERE user_id = ?", (user_id,)).fetchone()
+        budget = self.history_tokens
+        turns = []
+        for role, content, tokens, _ in reversed(pending):
+            budget -= tokens
+            if budget < 0:
+                break
+            turns.append({"role": role, "content": content})
+        if budget >= 0:
+            for role, content, tokens in self._db.execute(
+                    "SELECT role, content, tokens FROM messages WHERE user_id = ? ORDER BY id DESC", (user_id,)):
+                budget -= tokens
+                if budget < 0:
+                    break
+                turns.append({"role": role, "content": content})
+        turns.reverse()
+        if row:
+            turns.insert(0, {"role": "system", "content": f"Краткое содержание начала разговора:\n{row[0]}"})
+        return turns
+
+    # Контекст для LLM: краткое содержание старых реплик + окно последних в пределах бюджета токенов
+    async def get_context(self, user_id: int) -> list:
+        return await self._call(self._get_context, user_id, list(self._pending.get(user_id, ())))
+
+    # Запись буфера пачкой и сворачивание реплик, вышедших за бюджет, в краткое содержание
+    def _flush(self, batch: dict) -> None:
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO messages (user_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, *turn) for user_id, turns in batch.items() for turn in turns])
+            for user_id in batch:
+                self._compact(user_id)
+
+    def _compact(self, user_id: int) -> None:
+        budget = self.history_tokens
+        stale = []
+        for message_id, role, content, tokens in self._db.execute(
+                "SELECT id, role, content, tokens FROM messages WHERE user_id = ? ORDER BY id DESC", (user_id,)):
+            budget -= tokens
+            if budget < 0:
+                stale.append((message_id, role, content))
+        if not stale:
+            return
+        stale.reverse()
+        row = self._db.execute("SELECT summary FROM summaries WHERE user_id = ?", (user_id,)).fetchone()
+        lines = ([row[0]] if row else []) + [digest_turn(role, content) for _, role, content in stale]
+        summary = "\n".join(lines)
+        max_chars = self.summary_tokens * 3
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:].split("\n", 1)[-1]  # отбрасываем самые старые строки целиком
+        self._db.execute("INSERT OR REPLACE INTO summaries (user_id, summary) VALUES (?, ?)", (user_id, summary))
+        self._db.execute("DELETE FROM messages WHERE user_id = ? AND id <= ?", (user_id, stale[-1][0]))
+
+    async def flush(self) -> None:
+        if not self._pending or self._db is None:
+            return
+        batch, self._pending = dict(self._pending), defaultdict(list)
+        try:
+            await self._call(self._flush, batch)
+        except Exception:
+            for user_id, turns in batch.items():  # вернём реплики в буфер до следующей попытки
+                self._pending[user_id][:0] = turns
+            raise
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка записи истории: {str(e)}")
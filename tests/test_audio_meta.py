@@ -0,0 +1,127 @@
+import os
+import tempfile
+
+import pytest
+
+from audio_meta import mp3_info, pcm_duration
+from encoder import decode_pcm, run_ffmpeg
+
+SAMPLE_RATE = 24000
+FRAME_SECONDS = 576 / SAMPLE_RATE  # MPEG-2 Layer III: 576 сэмплов во фрейме
+
+
+# MP3 в духе gTTS: моно, 24 кГц; 3.312 с тона кодируются ровно в 140 фреймов = 3.36 с.
+# Пишется в файл: в pipe ffmpeg не может вернуться и дописать заголовок Xing
+def make_mp3(duration: float = 3.312, *extra) -> bytes:
+    fd, path = tempfile.mkstemp(suffix=".mp3")
+    os.close(fd)
+    try:
+        run_ffmpeg(["-y", "-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}", "-ac", "1",
+                    "-ar", str(SAMPLE_RATE)] + list(extra or ("-b:a", "32k")) + [path])
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def ffmpeg_duration(data: bytes) -> float:
+    return pcm_duration(len(decode_pcm(data, SAMPLE_RATE)), SAMPLE_RATE)
+
+
+# ID3v2.3 с заданным размером тела (синхробезопасное число) и нулевым заполнением
+def id3_tag(size: int) -> bytes:
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + b"\x00" * size
+
+
+# С заголовком Info/Xing ffmpeg читает из LAME-тега задержку кодера и добивку и отрезает их
+# при декодировании; mp3_info считает длительность по фреймам, разница меньше двух фреймов
+def assert_gapless(duration: float, data: bytes) -> None:
+    decoded = ffmpeg_duration(data)
+    assert decoded == pytest.approx(3.312, abs=0.005)
+    assert 0 < duration - decoded < 2 * FRAME_SECONDS
+
+
+@pytest.fixture(scope="module")
+def cbr():
+    return make_mp3(3.312, "-b:a", "32k")
+
+
+@pytest.fixture(scope="module")
+def vbr():
+    return make_mp3(3.312, "-q:a", "5")
+
+
+@pytest.fixture(scope="module")
+def no_xing():
+    return make_mp3(3.312, "-b:a", "32k", "-write_xing", "0")
+
+
+def test_cbr(cbr):
+    assert b"Info" in cbr[:1024]
+    info = mp3_info(cbr)
+    assert info.duration == pytest.approx(3.36)
+    assert info.frames == 140
+    assert info.sample_rate == SAMPLE_RATE
+    assert info.channels == 1
+    assert_gapless(info.duration, cbr)
+
+
+def test_vbr_with_xing_header(vbr):
+    assert b"Xing" in vbr[:1024]
+    info = mp3_info(vbr)
+    assert info.duration == pytest.approx(3.36)
+    assert info.frames == 140
+    assert_gapless(info.duration, vbr)
+
+
+def test_without_xing_header(no_xing):
+    assert b"Xing" not in no_xing[:1024] and b"Info" not in no_xing[:1024]
+    info = mp3_info(no_xing)
+    assert info.duration == pytest.approx(3.36)
+    assert info.duration == pytest.approx(ffmpeg_duration(no_xing))
+
+
+def test_leading_id3_tag(no_xing):
+    tagged = id3_tag(4096) + no_xing
+    assert mp3_info(tagged).duration == pytest.approx(3.36)
+
+
+def test_concatenated_gtts_parts():
+    first, second = make_mp3(1.2), make_mp3(2.16)
+    joined = first + second
+    assert mp3_info(joined).duration == pytest.approx(mp3_info(first).duration + mp3_info(second).duration)
+    # Каждая часть gTTS начинается со своего ID3-тега
+    tagged = id3_tag(64) + first + id3_tag(64) + second
+    assert mp3_info(tagged).duration == pytest.approx(mp3_info(joined).duration)
+
+
+def test_garbage_between_parts_is_skipped():
+    first, second = make_mp3(1.2), make_mp3(2.16)
+    joined = first + b"garbage!" * 16 + second
+    assert mp3_info(joined).duration == pytest.approx(mp3_info(first).duration + mp3_info(second).duration)
+
+
+def test_truncated_stream(no_xing):
+    full = mp3_info(no_xing).duration
+    truncated = mp3_info(no_xing[:len(no_xing) // 2])
+    assert 0 < truncated.duration < full
+    assert truncated.duration == pytest.approx(truncated.frames * FRAME_SECONDS)
+
+
+def test_truncated_vbr_ignores_stale_xing_count(vbr):
+    # Xing описывает весь поток, а от него осталась половина — фреймы пересчитываются
+    assert mp3_info(vbr[:len(vbr) // 2]).duration < 3.36
+
+
+@pytest.mark.parametrize("data", [b"", b"not an mp3 at all", b"\x00" * 4096, id3_tag(128)])
+def test_garbage_raises(data):
+    with pytest.raises(ValueError):
+        mp3_info(data)
+
+
+def test_pcm_duration():
+    assert pcm_duration(48000, 24000) == pytest.approx(1.0)
+    assert pcm_duration(96000, 24000, channels=2) == pytest.approx(1.0)
+    assert pcm_duration(72000, 24000, sample_width=3) == pytest.approx(1.0)
+    assert pcm_duration(0, 24000) == 0
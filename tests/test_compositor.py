@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from compositor import MouthSprites, load_mouth_sprites
+
+SIZE = (64, 64)
+
+
+@pytest.fixture
+def strip(tmp_path):
+    path = tmp_path / "mouth.png"
+    Image.new("RGBA", (16 * 3, 16), (255, 0, 0, 255)).save(path)
+    return str(path)
+
+
+# Спрайт у края кадра обрезается, наложение не падает на несовпадении форм
+@pytest.mark.parametrize("position", [(56, 56), (-8, -8), (56, 0)])
+def test_sprite_past_frame_edge_is_clipped(strip, position):
+    sprites = MouthSprites(strip, position, frame_size=SIZE)
+    frames = np.zeros((2,) + SIZE + (3,), dtype=np.uint8)
+    sprites.blend(frames, np.array([0, 2]))
+    assert frames[:, :, :, 0].sum() == 2 * 8 * (8 if position[1] else 16) * 255
+
+
+def test_sprite_outside_frame_is_rejected(strip):
+    with pytest.raises(ValueError):
+        MouthSprites(strip, (64, 10), frame_size=SIZE)
+    assert load_mouth_sprites(strip, "1000,1000") is None
@@ -0,0 +1,31 @@
+import pytest
+
+from encoder import encode_video_note
+from tts import Speech
+
+SIZE = (64, 64)
+FRAME = bytes(SIZE[0] * SIZE[1] * 3)
+
+
+def frames(count: int, fail_after: int = None, error: type = ValueError):
+    for index in range(count):
+        if index == fail_after:
+            raise error("кадр не собран")
+        yield FRAME
+
+
+def test_encodes_all_frames():
+    video = encode_video_note(frames(15), Speech(bytes(24000 * 2), 24000), fps=15, size=SIZE)
+    assert video[4:8] == b"ftyp"
+
+
+# Лишние кадры после -t: ffmpeg закрывает stdin раньше, это не ошибка
+def test_extra_frames_after_duration_are_ignored():
+    video = encode_video_note(frames(200), Speech(bytes(24000), 24000), fps=15, size=SIZE)
+    assert video[4:8] == b"ftyp"
+
+
+@pytest.mark.parametrize("error", [ValueError, RuntimeError])
+def test_frame_source_error_is_raised(error):
+    with pytest.raises(error, match="кадр не собран"):
+        encode_video_note(frames(15, fail_after=10, error=error), Speech(bytes(24000 * 2), 24000), fps=15, size=SIZE)
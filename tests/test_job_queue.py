@@ -0,0 +1,27 @@
+from job_queue import JobQueue
+
+
+def expire(queue: JobQueue, job) -> None:
+    queue._execute("UPDATE jobs SET lease_until = 0 WHERE id = ?", (job.id,))
+
+
+# Задача, чья аренда истекает на каждой попытке (воркер падает), выдаётся не больше max_attempts раз
+def test_expired_lease_is_reclaimed_until_attempts_run_out(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+    queue.enqueue("k", {"n": 1})
+    for attempt in (1, 2):
+        job = queue.claim("w")
+        assert (job.key, job.attempts) == ("k", attempt)
+        expire(queue, job)
+    assert queue.claim("w") is None
+    rows, _ = queue._execute("SELECT status, error FROM jobs WHERE key = 'k'")
+    assert rows == [("failed", "аренда истекла")]
+    assert queue.running() == 0
+
+
+def test_live_lease_is_not_reclaimed(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=1)
+    queue.enqueue("k", {})
+    assert queue.claim("w").attempts == 1
+    assert queue.claim("w") is None
+    assert queue.running() == 1
@@ -0,0 +1,153 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from aiogram.types import Chat, Message, User
+
+from metrics import USER_TURNS
+from user_flow import TokenBucket, UserFlowMiddleware
+
+DEBOUNCE = 0.05
+
+
+def message(text: str, user_id: int = 1, message_id: int = 1) -> Message:
+    return Message(message_id=message_id, date=datetime.now(), chat=Chat(id=user_id, type="private"),
+                   from_user=User(id=user_id, is_bot=False, first_name="user"), text=text)
+
+
+# Обработчик-заглушка: запоминает тексты ходов; поведение хода задаёт script(text, data)
+class FakeHandler:
+    def __init__(self, script=None):
+        self.script = script
+        self.calls = []
+        self.cancelled = []
+
+    async def __call__(self, event: Message, data: dict):
+        self.calls.append(event.text)
+        try:
+            if self.script is not None:
+                await self.script(event.text, data)
+        except asyncio.CancelledError:
+            self.cancelled.append(event.text)
+            raise
+        return event.text
+
+
+def outcomes() -> dict:
+    return {key[0]: value for key, value in USER_TURNS._values.items()}
+
+
+@pytest.fixture(autouse=True)
+def reset_counters():
+    USER_TURNS._values.clear()
+
+
+async def send(middleware: UserFlowMiddleware, handler: FakeHandler, text: str, message_id: int = 1):
+    data = {"handler": SimpleNamespace(flags={"user_flow": True})}
+    return await middleware(handler, message(text, message_id=message_id), data)
+
+
+# Отправка серии с паузами gap; результаты вызовов промежуточного слоя в порядке сообщений
+async def burst(middleware: UserFlowMiddleware, handler: FakeHandler, texts: list, gap: float) -> list:
+    tasks = []
+    for index, text in enumerate(texts):
+        tasks.append(asyncio.create_task(send(middleware, handler, text, message_id=index + 1)))
+        await asyncio.sleep(gap)
+    return await asyncio.gather(*tasks)
+
+
+def test_fast_burst_is_coalesced():
+    handler = FakeHandler()
+    middleware = UserFlowMiddleware(DEBOUNCE, rate=0, burst=5)
+    results = asyncio.run(burst(middleware, handler, ["a", "b", "c"], DEBOUNCE / 5))
+    assert handler.calls == ["a\nb\nc"]
+    assert results == [None, None, "a\nb\nc"]
+    assert outcomes() == {"coalesced": 2, "handled": 1}
+    assert middleware._users == {}
+
+
+def test_slow_burst_cancels_uncommitted_turn():
+    async def script(text, data):
+        if text == "a":
+            await asyncio.sleep(10)  # ответ ещё не отправлен — ход не зафиксирован
+
+    handler = FakeHandler(script)
+    middleware = UserFlowMiddleware(DEBOUNCE, rate=0, burst=2)
+    results = asyncio.run(burst(middleware, handler, ["a", "b"], DEBOUNCE * 3))
+    assert handler.calls == ["a", "a\nb"]
+    assert handler.cancelled == ["a"]
+    assert results == [None, "a\nb"]
+    # Отменённый ход вернул токен: из двух потрачен один
+    assert middleware._buckets[1].tokens == pytest.approx(1)
+    assert outcomes() == {"superseded": 1, "handled": 1}
+
+
+def test_committed_turn_is_not_cancelled():
+    async def script(text, data):
+        if text == "a":
+            data["turn"].commit()  # первая отправка уже ушла пользователю
+            await asyncio.sleep(DEBOUNCE * 4)
+
+    handler = FakeHandler(script)
+    middleware = UserFlowMiddleware(DEBOUNCE, rate=0, burst=5)
+    results = asyncio.run(burst(middleware, handler, ["a", "b"], DEBOUNCE * 2))
+    assert handler.calls == ["a", "b"]
+    assert handler.cancelled == []
+    assert results == ["a", "b"]
+    assert outcomes() == {"handled": 2}
+
+
+def test_turns_are_limited_by_balance(monkeypatch):
+    replies = []
+
+    async def reply(self, text, **kwargs):
+        replies.append(text)
+
+    async def balance(user_id):
+        return 1
+
+    monkeypatch.setattr(Message, "reply", reply)
+    handler = FakeHandler()
+    middleware = UserFlowMiddleware(DEBOUNCE, rate=0, burst=5, balance=balance)
+
+    async def scenario():
+        return [await send(middleware, handler, "a"), await send(middleware, handler, "b", message_id=2)]
+
+    assert asyncio.run(scenario()) == ["a", None]
+    assert handler.calls == ["a"]
+    assert len(replies) == 1
+    assert outcomes() == {"handled": 1, "limited": 1}
+
+
+def test_unflagged_handler_is_passed_through():
+    handler = FakeHandler()
+    middleware = UserFlowMiddleware(DEBOUNCE, rate=0, burst=1)
+    result = asyncio.run(middleware(handler, message("a"), {}))
+    assert result == "a"
+    assert outcomes() == {}
+
+
+def test_token_bucket_take_is_capped_by_limit():
+    bucket = TokenBucket(rate=0, burst=5)
+    assert bucket.take(2)
+    assert bucket.tokens == pytest.approx(1)
+    assert bucket.take(2)
+    assert not bucket.take(2)
+    bucket.refund()
+    assert bucket.take()
+    assert not bucket.take(0)
+
+
+def test_token_bucket_refills_up_to_burst(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("user_flow.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        assert bucket.take()
+    assert not bucket.take()
+    now[0] += 0.5
+    assert bucket.take()
+    now[0] += 60
+    assert bucket.full()
+    assert bucket.tokens == 3
@@ -0,0 +1,184 @@
+import io
+import time
+import logging
+from abc import ABC, abstractmethod
+
+from config import TTS_ENGINES, TTS_LANG, TTS_TLD, TTS_TIMEOUT, PIPER_MODEL
+from audio_meta import pcm_duration, mp3_info
+from encoder import decode_pcm
+from metrics import TTS_SECONDS, STAGE_ERRORS
+
+
+# Синтезированная речь: сырые данные, частота дискретизации и точная длительность
+class Speech:
+    def __init__(self, data: bytes, sample_rate: int, duration: float = None, format: str = "s16le"):
+        self.data = data
+        self.sample_rate = sample_rate
+        self.format = format  # "s16le" — моно PCM 16 бит, иначе формат контейнера для ffmpeg
+        self.duration = duration if duration is not None else pcm_duration(len(data), sample_rate)
+
+    # Аргументы ffmpeg для чтения этого аудио
+    def input_args(self) -> list:
+        if self.format == "s16le":
+            return ["-f", "s16le", "-ar", str(self.sample_rate), "-ac", "1"]
+        return ["-f", self.format]
+
+    def to_pcm(self, sample_rate: int = None) -> "Speech":
+        sample_rate = sample_rate or self.sample_rate
+        if self.format == "s16le" and sample_rate == self.sample_rate:
+            return self
+        return Speech(decode_pcm(self.data, sample_rate, self.input_args()), sample_rate)
+
+
+# Склейка фрагментов речи в одну дорожку; разнородные фрагменты приводятся к PCM
+def join_speech(parts: list) -> Speech:
+    if len(parts) == 1:
+        return parts[0]
+    first = parts[0]
+    if all(part.format == first.format and part.sample_rate == first.sample_rate for part in parts):
+        if first.format in ("s16le", "mp3"):  # MP3-фреймы тоже склеиваются без перекодирования
+            return Speech(b"".join(part.data for part in parts), first.sample_rate,
+                          sum(part.duration for part in parts), first.format)
+    parts = [part.to_pcm(first.sample_rate) for part in parts]
+    return Speech(b"".join(part.data for part in parts), first.sample_rate)
+
+
+# Движок TTS: синтез одной фразы или нескольких за один вызов
+class TTSEngine(ABC):
+    name = "base"
+
+    @abstractmethod
+    def synthesize(self, text: str) -> Speech:
+        ...
+
+    def synthesize_batch(self, texts: list) -> list:
+        return [self.synthesize(text) for text in texts]
+
+
+# gTTS: удалённый синтез Google; mp3 передаётся дальше как есть, точная длительность
+# берётся из заголовков фреймов без декодирования
+class GTTSEngine(TTSEngine):
+    name = "gtts"
+
+    def __init__(self, lang: str = TTS_LANG, tld: str = TTS_TLD, timeout: float = TTS_TIMEOUT, sample_rate: int = 24000):
+        self.lang = lang
+        self.tld = tld
+        self.timeout = timeout
+        self.sample_rate = sample_rate
+
+    def synthesize(self, text: str) -> Speech:
+        from gtts import gTTS
+        tts = gTTS(text=text, lang=self.lang, slow=False, tld=self.tld, timeout=self.timeout)
+        audio_bytes = io.BytesIO()
+        tts.write_to_fp(audio_bytes)
+        audio_data = audio_bytes.getvalue()
+        try:
+            info = mp3_info(audio_data)
+        except ValueError as e:
+            logging.warning(f"Не удалось разобрать mp3 gTTS ({str(e)}), декодируем в PCM")
+            return Speech(decode_pcm(audio_data, self.sample_rate), self.sample_rate)
+        return Speech(audio_data, info.sample_rate, info.duration, format="mp3")
+
+
+# Piper: локальная ONNX-модель на CPU, загружается один раз на процесс и остаётся в памяти
+class PiperEngine(TTSEngine):
+    name = "piper"
+
+    def __init__(self, model_path: str = PIPER_MODEL):
+        self.model_path = model_path
+        self.voice = None
+
+    def _load(self):
+        if self.voice is None:
+            if not self.model_path:
+                raise RuntimeError("PIPER_MODEL не задан")
+            from piper import PiperVoice  # необязательная зависимость: pip install piper-tts
+            self.voice = PiperVoice.load(self.model_path)
+            logging.info(f"Модель Piper загружена: {self.model_path}")
+        return self.voice
+
+    def synthesize(self, text: str) -> Speech:
+        voice = self._load()
+        if hasattr(voice, "synthesize_stream_raw"):
+            pcm = b"".join(voice.synthesize_stream_raw(text))
+            sample_rate = voice.config.sample_rate
+        else:
+            chunks = list(voice.synthesize(text))
+            pcm = b"".join(chunk.audio_int16_bytes for chunk in chunks)
+            sample_rate = chunks[0].sample_rate if chunks else voice.config.sample_rate
+        return Speech(pcm, sample_rate)
+
+
+# Цепочка движков: при ошибке или таймауте фраза синтезируется следующим движком
+class FallbackEngine(TTSEngine):
+    def __init__(self, engines: list):
+        self.engines = engines
+        self.name = ",".join(engine.name for engine in engines)
+
+    def synthesize_batch(self, texts: list) -> list:
+        for i, engine in enumerate(self.engines):
+            try:
+                return engine.synthesize_batch(texts)
+            except Exception as e:
+                if i == len(self.engines) - 1:
+                    raise
+                logging.warning(f"TTS {engine.name} не справился ({str(e)}), переключаемся на {self.engines[i + 1].name}")
+
+    def synthesize(self, text: str) -> Speech:
+        return self.synthesize_batch([text])[0]
+
+
+# Заглушка для бенчмарков и локальной отладки: тон фиксированной громкости, длительность
+# пропорциональна длине текста (~темп речи gTTS), без сети и моделей
+class FixedAudioEngine(TTSEngine):
+    name = "fixed"
+
+    def __init__(self, sample_rate: int = 24000, chars_per_second: float = 14.0, min_duration: float = 0.5):
+        self.sample_rate = sample_rate
+        self.chars_per_second = chars_per_second
+        self.min_duration = min_duration
+
+    def synthesize(self, text: str) -> Speech:
+        import numpy as np
+        duration = max(self.min_duration, len(text) / self.chars_per_second)
+        t = np.arange(int(duration * self.sample_rate)) / self.sample_rate
+        pcm = (np.sin(2 * np.pi * 220 * t) * 8000).astype("<i2")
+        return Speech(pcm.tobytes(), self.sample_rate)
+
+
+ENGINES = {
+    "gtts": GTTSEngine,
+    "piper": PiperEngine,
+    "fixed": FixedAudioEngine,
+}
+
+_engine = None
+
+
+# Движок процесса по настройке TTS_ENGINES (в порядке приоритета), создаётся один раз
+def get_engine() -> TTSEngine:
+    global _engine
+    if _engine is None:
+        engines = [ENGINES[name.strip()]() for name in TTS_ENGINES.split(",") if name.strip()]
+        _engine = engines[0] if len(engines) == 1 else FallbackEngine(engines)
+        logging.info(f"TTS: {_engine.name}")
+    return _engine
+
+
+# Синтез нескольких фраз одним вызовом (выполняется в процессе-воркере)
+def synthesize_batch(texts: list) -> list:
+    engine = get_engine()
+    started = time.perf_counter()
+    try:
+        speeches = engine.synthesize_batch(texts)
+    except Exception:
+        STAGE_ERRORS.inc(stage="tts")
+        raise
+    TTS_SECONDS.observe(time.perf_counter() - started, engine=engine.name)
+    for text, speech in zip(texts, speeches):
+        logging.info(f"Аудио создано, длительность: {speech.duration:.2f} сек, {len(text)} символов")
+    return speeches
+
+
+def synthesize(text: str) -> Speech:
+    return synthesize_batch([text])[0]
@@ -0,0 +1,136 @@
+import time
+import asyncio
+import logging
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message
+
+from metrics import USER_TURNS
+
+PRUNE_THRESHOLD = 1024  # при таком числе вёдер полные (неотличимые от новых) удаляются
+
+
+# Ведро токенов на ходы пользователя: пополнение rate токенов в секунду, запас burst,
+# но не больше баланса — пользователь не запустит больше ответов, чем может оплатить
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, capacity: float) -> None:
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, limit: int = None) -> bool:
+        self._refill(self.burst if limit is None else min(self.burst, limit))
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    # Возврат токена за ход, который так и не дошёл до ответа
+    def refund(self) -> None:
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def full(self) -> bool:
+        self._refill(self.burst)
+        return self.tokens >= self.burst
+
+
+# Ход диалога, собранный из одного или нескольких сообщений; обработчик вызывает commit()
+# перед первой отправкой, после этого новое сообщение уже не отменяет ход
+class Turn:
+    def __init__(self, count: int):
+        self.count = count
+        self.committed = False
+
+    def commit(self) -> None:
+        self.committed = True
+
+
+class UserState:
+    def __init__(self):
+        self.texts = []  # сообщения, ещё не вошедшие в завершённый ход
+        self.generation = 0
+        self.task = None
+        self.turn = None
+
+
+# Промежуточный слой диспетчера для обработчиков с флагом user_flow:
+# - серия сообщений, пришедших с паузами короче debounce, склеивается в один ход;
+# - новое сообщение отменяет ещё не отправленный ответ на предыдущие (LLM, TTS и ожидание
+#   рендера прерываются, до кодирования дело не доходит), и его текст входит в новый ход;
+# - ходы пользователя идут строго по очереди и ограничены ведром токенов.
+# balance — корутина user_id -> кредиты (Storage.get_balance)
+class UserFlowMiddleware(BaseMiddleware):
+    def __init__(self, debounce: float, rate: float, burst: int, balance=None):
+        self.debounce = debounce
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.balance = balance
+        self._users = {}
+        self._buckets = {}
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        if user_id not in self._buckets:
+            if len(self._buckets) >= PRUNE_THRESHOLD:
+                for key in [key for key, bucket in self._buckets.items() if bucket.full()]:
+                    del self._buckets[key]
+            self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return self._buckets[user_id]
+
+    async def __call__(self, handler, event, data):
+        if not get_flag(data, "user_flow") or not isinstance(event, Message) or event.from_user is None or not event.text:
+            return await handler(event, data)
+        user_id = event.from_user.id
+        state = self._users.setdefault(user_id, UserState())
+        state.texts.append(event.text)
+        state.generation += 1
+        generation = state.generation
+        if state.task is not None and not state.task.done() and not state.turn.committed:
+            logging.info(f"Новое сообщение от {user_id}: ответ на предыдущие отменяется")
+            state.task.cancel()
+        try:
+            await asyncio.sleep(self.debounce)
+            while state.task is not None and not state.task.done():
+                await asyncio.wait([state.task])
+            if state.generation != generation:
+                USER_TURNS.inc(outcome="coalesced")
+                return None
+            return await self._run(handler, event, data, user_id, state)
+        finally:
+            if state.generation == generation and not state.texts and (state.task is None or state.task.done()):
+                self._users.pop(user_id, None)
+
+    async def _run(self, handler, event: Message, data: dict, user_id: int, state: UserState):
+        count = len(state.texts)
+        balance = await self.balance(user_id) if self.balance is not None else None
+        # Нулевой баланс пропускается: обработчик сам предложит пополнить
+        if balance != 0 and not self._bucket(user_id).take(balance):
+            del state.texts[:count]
+            USER_TURNS.inc(outcome="limited")
+            logging.warning(f"Лимит ходов для {user_id}: сообщение отклонено")
+            await event.reply("Слишком много сообщений подряд. Подожди немного и напиши ещё раз.")
+            return None
+        if count > 1:
+            event = event.model_copy(update={"text": "\n".join(state.texts[:count])})
+            logging.info(f"Склеено {count} сообщений от {user_id} в один ход")
+        state.turn = data["turn"] = Turn(count)
+        task = state.task = asyncio.create_task(handler(event, data))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            self._bucket(user_id).refund()
+            USER_TURNS.inc(outcome="superseded")
+            return None
+        except Exception:
+            del state.texts[:count]
+            raise
+        del state.texts[:count]
+        USER_TURNS.inc(outcome="handled")
+        return result
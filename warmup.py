@@ -0,0 +1,100 @@
+import time
+import asyncio
+import logging
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+from media_cache import MediaCache, CachedMedia
+from render import remove_emojis, render_reply, reply_cache_key, warm_render
+from render_pool import RenderExecutor
+
+
+# Прогрев при старте бота: процессы пула рендера поднимаются заранее и делают пробное
+# кодирование, частые фразы (приветствие, ответ при ошибке) рендерятся в кэш медиа и
+# закрепляются там, а при заданном служебном чате один раз загружаются в Telegram ради file_id.
+# Выполняется фоновой задачей: webhook принимает апдейты, не дожидаясь прогрева.
+# Только для RENDER_BACKEND=pool: в режиме очереди фразы готовит render_worker.py.
+class Warmup:
+    def __init__(self, bot: Bot, executor: RenderExecutor, cache: MediaCache, phrases: list, chat_id: str = None):
+        self.bot = bot
+        self.executor = executor
+        self.cache = cache
+        self.phrases = list(phrases)
+        self.chat_id = chat_id or None
+        self.timings = {}
+        self.entries = {}  # фраза -> закреплённая запись кэша
+        self._task = None
+
+    # Регистрируется в dp.startup
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    # Вызывается из on_shutdown бота
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self) -> dict:
+        started = time.perf_counter()
+        # По задаче на воркер: пул запускает все процессы, каждый готовит аватар и кодирует пробный ролик
+        results = await asyncio.gather(*(self.executor.run(warm_render) for _ in range(self.executor.workers)),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"Прогрев воркера рендера не удался: {str(result)}")
+        self.timings["workers"] = time.perf_counter() - started
+
+        phrases_started = time.perf_counter()
+        ready = 0
+        for phrase in self.phrases:
+            try:
+                ready += await self.prerender(phrase) is not None
+            except Exception as e:
+                logging.error(f"Фраза для прогрева не подготовлена ({phrase!r}): {str(e)}")
+        self.timings["phrases"] = time.perf_counter() - phrases_started
+        self.timings["total"] = time.perf_counter() - started
+        logging.info(f"Прогрев завершён за {self.timings['total']:.2f} сек: готово фраз {ready}/{len(self.phrases)}, "
+                     f"{', '.join(f'{stage} {value:.2f}' for stage, value in self.timings.items())}")
+        return self.timings
+
+    # Видеокружок фразы в кэше медиа; уже готовые фразы не рендерятся повторно
+    async def prerender(self, phrase: str) -> CachedMedia:
+        clean_text = remove_emojis(phrase).strip()
+        if not clean_text:
+            return None
+        key = reply_cache_key(clean_text)
+        entry = self.cache.peek(key)
+        video_data = None
+        if entry is None:
+            video_data, speech = await self.executor.run(render_reply, clean_text)
+            entry = self.cache.put(key, speech.data, video_data, speech.duration, audio_ext=speech.format)
+        self.cache.pin(key)
+        self.entries[phrase] = entry
+        if entry.file_id is None and self.chat_id:
+            await self.upload(entry, video_data or self.cache.read_video(key))
+        return entry
+
+    # Загрузка в служебный чат ради file_id; само сообщение сразу удаляется
+    async def upload(self, entry: CachedMedia, video_data: bytes) -> None:
+        sent = await self.bot.send_video_note(
+            self.chat_id,
+            BufferedInputFile(video_data, filename="video_note.mp4"),
+            duration=int(entry.duration),
+            length=480,
+            disable_notification=True
+        )
+        if sent.video_note:
+            self.cache.set_file_id(entry.key, sent.video_note.file_id)
+        try:
+            await self.bot.delete_message(self.chat_id, sent.message_id)
+        except Exception as e:
+            logging.warning(f"Служебное сообщение прогрева не удалено: {str(e)}")
+
+    # Готовый видеокружок фразы или None, если прогрев до неё ещё не дошёл (статистику кэша не трогает)
+    def entry(self, phrase: str) -> CachedMedia:
+        return self.entries.get(phrase)